@@ -0,0 +1,16 @@
+"""Numba 兼容层：未安装 numba 时 njit 退化为不做任何处理的装饰器"""
+
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+    def njit(*args, **kwargs):
+        """空装饰器，同时支持 @njit 与 @njit(cache=True) 两种写法"""
+        if len(args) == 1 and callable(args[0]) and not kwargs:
+            return args[0]
+
+        def decorator(func):
+            return func
+        return decorator
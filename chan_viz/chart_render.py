@@ -1,10 +1,90 @@
+import numpy as np
+import plotly
 import plotly.graph_objects as go
+import plotly.io as pio
+from types import MappingProxyType
 from typing import Dict
+from ._njit import njit, NUMBA_AVAILABLE
+
+# 安装了orjson时使用其序列化figure（streamlit通过plotly.io.to_json传输图表），numpy数组走原生快速路径
+try:
+    import orjson  # noqa: F401
+    pio.json.config.default_engine = 'orjson'
+except ImportError:
+    pass
+
+# 横坐标（K线序号）传给前端时使用的精度：plotly 6+ 将numpy数组按原始dtype以二进制编码传输，
+# 序号是整数，float32/int32在2^24以内可精确表示且体积减半；更早的版本会先转成Python列表，float32反而放大JSON。
+# 价格始终按float64传输：float32只有约7位有效数字，BTC约1e5时最小间隔约0.008，已丢失分位
+_WIRE_FLOAT = np.float32 if int(plotly.__version__.split('.')[0]) >= 6 else np.float64
+_WIRE_INT = np.int32 if _WIRE_FLOAT is np.float32 else np.int64
+
+# 买卖点类别 -> 标记大小：一类稍大，二类标准，三类稍小，未知类型使用默认大小
+_BSP_SIZE_BY_CLASS = MappingProxyType({'1': 14, '2': 12, '3': 10})
+_BSP_DEFAULT_SIZE = 12
+
+# K线数量超过该值时改用WebGL绘制：SVG蜡烛图每根K线生成多个DOM节点，数据量大时浏览器明显卡顿
+_WEBGL_KLINE_THRESHOLD = 2000
+
+# K线数量超过该值时按桶聚合后再绘制：超出屏幕像素列数的K线无法分辨，只会增加传输和渲染开销
+_KLINE_DOWNSAMPLE_TARGET = 4000
+
+
+def _interleave_segments(start, end):
+    """将n组起止点交错为 [s0, e0, gap, s1, e1, gap, ...]，gap(None/NaN)用于断开相邻线段"""
+    start = np.asarray(start)
+    end = np.asarray(end)
+    if start.dtype == object or end.dtype == object:
+        out = np.empty(3 * len(start), dtype=object)
+        gap = None
+    else:
+        out = np.empty(3 * len(start), dtype=np.float64)
+        gap = np.nan
+    out[0::3] = start
+    out[1::3] = end
+    out[2::3] = gap
+    return out
+
+
+def _m4_downsample(x, open_arr, high_arr, low_arr, close_arr, target):
+    """将K线均分为target个桶聚合：取首开、末收、最高、最低，横坐标取桶中点
+    
+    笔/线段等仍使用原始K线序号，聚合后的K线画在数值横轴的相同位置上，二者保持对齐
+    """
+    n = len(x)
+    starts = np.linspace(0, n, target + 1).astype(np.int64)[:-1]
+    ends = np.append(starts[1:], n) - 1
+    return (
+        (x[starts] + x[ends]) / 2,
+        open_arr[starts],
+        np.maximum.reduceat(high_arr, starts),
+        np.minimum.reduceat(low_arr, starts),
+        close_arr[ends]
+    )
+
+
+@njit(cache=True)
+def _price_range(low, high):
+    """单次循环同时求最低价与最高价，返回价格范围（numba可用时编译为机器码）"""
+    min_price = low[0]
+    max_price = high[0]
+    for i in range(1, low.shape[0]):
+        if low[i] < min_price:
+            min_price = low[i]
+        if high[i] > max_price:
+            max_price = high[i]
+    return max_price - min_price
+
 
 class PlotlyChartRenderer:
-    """Plotly图表渲染器"""
+    """Plotly图表渲染器
     
-    def __init__(self):
+    fast=True 时以dict形式组装trace并跳过plotly属性校验，
+    fast=False 时走完整校验流程，便于调试trace参数。
+    """
+    
+    def __init__(self, fast: bool = True):
+        self.fast = fast
         self.colors = {
             'bi': '#FF6B6B',
             'zs': '#45B7D1', 
@@ -12,294 +92,368 @@ class PlotlyChartRenderer:
             'bsp_buy': '#00FF00',
             'bsp_sell': '#FF0000'
         }
+        # 预先构建线型：{元素: {is_sure: line}}，确定的用实线/点线，不确定的用虚线
+        self._line_styles = {
+            'bi': {
+                True: {'color': self.colors['bi'], 'width': 1.5},
+                False: {'color': self.colors['bi'], 'width': 1.5, 'dash': 'dash'}
+            },
+            'seg': {
+                True: {'color': self.colors['seg'], 'width': 2.5},
+                False: {'color': self.colors['seg'], 'width': 2.5, 'dash': 'dash'}
+            },
+            'zs': {
+                True: {'color': self.colors['zs'], 'width': 1, 'dash': 'dot'},
+                False: {'color': self.colors['zs'], 'width': 1, 'dash': 'dash'}
+            }
+        }
+        self._bi_marker = {'size': 4}
+        # 简洁布局 - 去掉多余控件，只保留主图和图例
+        self._base_layout = {
+            'xaxis': {
+                'rangeslider': {'visible': False},  # 去掉slide控件
+                'type': 'linear',  # K线序号作为数值横轴，日期通过刻度标签显示
+                'title': {'text': "时间"},
+                'showgrid': False,
+                'fixedrange': True,  # 禁用缩放
+                # 十字准线：hover到笔/买卖点时贯穿整个绘图区，代替K线逐点hover
+                'showspikes': True,
+                'spikemode': 'across',
+                'spikesnap': 'cursor',
+                'spikethickness': 1,
+                'spikedash': 'dot',
+                'spikecolor': 'gray'
+            },
+            'yaxis': {
+                'title': {'text': "价格"},
+                'showgrid': True,
+                'gridcolor': 'lightgray',
+                'fixedrange': True  # 禁用缩放
+            },
+            'height': 600,
+            'showlegend': True,
+            # fast模式跳过校验时不会按名称解析模板，这里直接使用模板对象
+            'template': pio.templates['plotly_white'],
+            'hovermode': 'closest',
+            'margin': {'l': 50, 'r': 20, 't': 60, 'b': 50},
+            'plot_bgcolor': 'white',
+            'paper_bgcolor': 'white',
+            # 数据更新时不播放过渡动画，避免逐帧重绘所有数据点
+            'transition': {'duration': 0},
+            # 去掉工具栏，只保留基本功能
+            'modebar': {
+                'remove': ['zoom2d', 'pan2d', 'select2d', 'lasso2d', 'zoomin2d', 'zoomout2d', 'autoScale2d', 'resetScale2d']
+            }
+        }
     
-    def create_chan_chart(self, data: Dict, level: str, code: str = "") -> go.Figure:
-        """创建缠论核心图表 - 只包含K线和缠论指标"""
+    def create_chan_chart(self, data: Dict, level: str, code: str = "", display: Dict[str, bool] = None) -> go.Figure:
+        """创建缠论核心图表 - 只包含K线和缠论指标
         
-        # 创建基础图形 - 单行显示，专注核心
-        fig = go.Figure()
+        display: 前端显示开关 show_bi/show_seg/show_zs/show_bsp，缺省时全部显示
+        """
+        display = display or {}
+        
+        # 所有trace先以dict形式收集，最后一次性构建Figure
+        traces = []
         
-        # 获取日期列表用于索引映射
-        dates = data['kline']['dates']
+        # 获取日期序列用于hover和刻度标签：只转换一次并缓存长度，供后续所有索引查找复用
+        # 横轴直接使用K线序号（数值轴），避免category轴为每个日期字符串分配槽位
+        dates = np.asarray(data['kline']['dates'], dtype=object)
+        n_dates = len(dates)
+        x_idx = data['kline'].get('idx')
+        x_idx = np.arange(n_dates) if x_idx is None else np.asarray(x_idx)
         
         # 添加K线图
-        fig.add_trace(go.Candlestick(
-            x=dates,
-            open=data['kline']['open'],
-            high=data['kline']['high'],
-            low=data['kline']['low'],
-            close=data['kline']['close'],
-            name='K线',
-            increasing_line_color='red',  # A股红色上涨
-            decreasing_line_color='green',
-            showlegend=True
-        ))
+        traces.extend(self._build_kline_traces(data['kline'], x_idx, dates))
         
-        # 添加笔的图例项（只添加一次）
-        if 'bi' in data and data['bi']:
-            # 添加笔的图例
-            fig.add_trace(go.Scatter(
-                x=[None], y=[None],
-                mode='lines+markers',
-                name='笔',
-                line=dict(color=self.colors['bi'], width=1.5),
-                marker=dict(size=4),
-                showlegend=True
-            ))
-            
-            # 添加具体的笔数据
-            for i, bi in enumerate(data['bi']):
-                # 将索引映射为日期
-                x_indices = bi['x']
-                x_dates = [dates[idx] for idx in x_indices if idx < len(dates)]
-                
-                if len(x_dates) == len(bi['y']):  # 确保坐标对应
-                    # 根据is_sure决定线型：确定的笔用实线，不确定的用虚线
-                    is_sure = bi.get('is_sure', True)
-                    line_style = dict(color=self.colors['bi'], width=1.5)
-                    if not is_sure:
-                        line_style['dash'] = 'dash'
-                    
-                    fig.add_trace(go.Scatter(
-                        x=x_dates,
-                        y=bi['y'],
-                        mode='lines+markers',
-                        line=line_style,
-                        marker=dict(size=4),
-                        hovertemplate="笔: %{y:.2f}<br>日期: %{x}<br>状态: %{customdata}<extra></extra>",
-                        customdata=["确定" if is_sure else "不确定"],
-                        showlegend=False  # 不在图例中显示具体笔
-                    ))
+        # 添加笔：没有可绘制的笔时不生成任何trace
+        # 图例挂在第一条实际绘制的trace上，两条trace共享legendgroup以便整体显示/隐藏
+        bi_data = data.get('bi')
+        if display.get('show_bi', True) and bi_data is not None and len(bi_data['x0']):
+            show_legend = True
+            # 添加具体的笔数据：按is_sure分组，所有笔合并为最多两条WebGL trace
+            for is_sure, (xs, ys, hover) in self._group_lines_by_sure(bi_data, x_idx, dates, n_dates).items():
+                traces.append(dict(
+                    type='scattergl',
+                    x=xs,
+                    y=ys,
+                    mode='lines+markers',
+                    line=self._line_styles['bi'][is_sure],  # 确定的笔用实线，不确定的用虚线
+                    marker=self._bi_marker,
+                    hovertemplate="笔: %{y:.2f}<br>日期: %{customdata[0]}<br>状态: %{customdata[1]}<extra></extra>",
+                    customdata=hover,
+                    name='笔',
+                    legendgroup='bi',
+                    showlegend=show_legend
+                ))
+                show_legend = False
         
-        # 添加线段的图例项（只添加一次）
-        if 'segment' in data and data['segment']:
-            # 添加线段的图例
-            fig.add_trace(go.Scatter(
-                x=[None], y=[None],
-                mode='lines',
-                name='线段',
-                line=dict(color=self.colors['seg'], width=2.5),
-                showlegend=True
-            ))
-            
-            # 添加具体的线段数据
-            for i, seg in enumerate(data['segment']):
-                # 将索引映射为日期
-                x_indices = seg['x']
-                x_dates = [dates[idx] for idx in x_indices if idx < len(dates)]
-                
-                if len(x_dates) == len(seg['y']):  # 确保坐标对应
-                    # 根据is_sure决定线型：确定的线段用实线，不确定的用虚线
-                    is_sure = seg.get('is_sure', True)
-                    line_style = dict(color=self.colors['seg'], width=2.5)
-                    if not is_sure:
-                        line_style['dash'] = 'dash'
-                    
-                    fig.add_trace(go.Scatter(
-                        x=x_dates,
-                        y=seg['y'],
-                        mode='lines',
-                        line=line_style,
-                        hovertemplate="线段: %{y:.2f}<br>日期: %{x}<br>状态: %{customdata}<extra></extra>",
-                        customdata=["确定" if is_sure else "不确定"],
-                        showlegend=False  # 不在图例中显示具体线段
-                    ))
+        # 添加线段：处理方式与笔相同
+        seg_data = data.get('segment')
+        if display.get('show_seg', True) and seg_data is not None and len(seg_data['x0']):
+            show_legend = True
+            # 添加具体的线段数据：按is_sure分组，所有线段合并为最多两条WebGL trace
+            for is_sure, (xs, ys, hover) in self._group_lines_by_sure(seg_data, x_idx, dates, n_dates).items():
+                traces.append(dict(
+                    type='scattergl',
+                    x=xs,
+                    y=ys,
+                    mode='lines',
+                    line=self._line_styles['seg'][is_sure],  # 确定的线段用实线，不确定的用虚线
+                    hovertemplate="线段: %{y:.2f}<br>日期: %{customdata[0]}<br>状态: %{customdata[1]}<extra></extra>",
+                    customdata=hover,
+                    name='线段',
+                    legendgroup='segment',
+                    showlegend=show_legend
+                ))
+                show_legend = False
         
-        # 添加中枢的图例项（只添加一次）
-        if 'central_zone' in data and data['central_zone']:
-            # 添加中枢的图例
-            fig.add_trace(go.Scatter(
-                x=[None], y=[None],
-                mode='lines',
-                name='中枢',
-                line=dict(color=self.colors['zs'], width=1, dash='dot'),
-                fill='toself',
-                fillcolor='rgba(69, 183, 209, 0.25)',
-                showlegend=True
-            ))
+        # 添加中枢：处理方式与笔相同
+        zs_data = data.get('central_zone')
+        if display.get('show_zs', True) and zs_data is not None and len(zs_data['x0']):
+            show_legend = True
+            # 添加具体的中枢数据：矩形之间用间隔断开，按线型合并为最多两条填充trace
+            # 填充trace不响应hover，所有中枢的hover信息统一挂在一条角点标记trace上
+            zs_x0 = np.asarray(zs_data['x0'])
+            zs_x1 = np.asarray(zs_data['x1'])
+            zs_low = np.asarray(zs_data['y0'], dtype=np.float64)
+            zs_high = np.asarray(zs_data['y1'], dtype=np.float64)
+            zs_sure = np.asarray(zs_data['is_sure'], dtype=bool)
+            valid = np.flatnonzero((zs_x0 < n_dates) & (zs_x1 < n_dates))
+            x_start = x_idx[zs_x0[valid]].astype(np.float64)
+            x_end = x_idx[zs_x1[valid]].astype(np.float64)
+            y_low, y_high = zs_low[valid], zs_high[valid]
+            gap = np.full(len(valid), np.nan)
             
-            # 添加具体的中枢数据
-            for i, zs in enumerate(data['central_zone']):
-                # 将索引映射为日期
-                x_indices = zs['x']
-                if len(x_indices) >= 2 and all(idx < len(dates) for idx in x_indices):
-                    x_start, x_end = dates[x_indices[0]], dates[x_indices[1]]
-                    y_low, y_high = zs['y'][0], zs['y'][1]
-                    
-                    # 根据is_sure决定线型：确定的中枢用点线，不确定的用虚线
-                    is_sure = zs.get('is_sure', True)
-                    line_style = dict(color=self.colors['zs'], width=1)
-                    if is_sure:
-                        line_style['dash'] = 'dot'  # 确定的中枢用点线
-                    else:
-                        line_style['dash'] = 'dash'  # 不确定的中枢用虚线
-                    
-                    # 创建矩形区域
-                    fig.add_trace(go.Scatter(
-                        x=[x_start, x_end, x_end, x_start, x_start],
-                        y=[y_low, y_low, y_high, y_high, y_low],
-                        fill='toself',
-                        fillcolor='rgba(69, 183, 209, 0.25)',
-                        line=line_style,
-                        hovertemplate=f"中枢 {i+1}<br>范围: {y_low:.2f} - {y_high:.2f}<br>状态: {'确定' if is_sure else '不确定'}<extra></extra>",
-                        showlegend=False  # 不在图例中显示具体中枢
-                    ))
-        
-        # 添加买卖点的图例项（只添加一次）
-        if 'buy_sell_points' in data and data['buy_sell_points']:
-            # 添加买点图例
-            fig.add_trace(go.Scatter(
-                x=[None], y=[None],
-                mode='markers',
-                name='买点',
-                marker=dict(size=12, color=self.colors['bsp_buy'], symbol='triangle-up', line=dict(width=2, color='white')),
-                showlegend=True
-            ))
+            # 每个矩形依次为 左下、右下、右上、左上、闭合点、间隔，按行展开即为完整的多边形序列
+            rect_x = np.column_stack((x_start, x_end, x_end, x_start, x_start, gap)).astype(_WIRE_FLOAT)
+            rect_y = np.column_stack((y_low, y_low, y_high, y_high, y_low, gap))
+            for is_sure in (True, False):
+                rows = zs_sure[valid] == is_sure
+                if not rows.any():
+                    continue
+                # 创建矩形区域
+                traces.append(dict(
+                    type='scatter',
+                    x=rect_x[rows].ravel(),
+                    y=rect_y[rows].ravel(),
+                    mode='lines',
+                    fill='toself',
+                    fillcolor='rgba(69, 183, 209, 0.25)',
+                    line=self._line_styles['zs'][is_sure],  # 确定的中枢用点线，不确定的用虚线
+                    hoverinfo='skip',
+                    name='中枢',
+                    legendgroup='central_zone',
+                    showlegend=show_legend
+                ))
+                show_legend = False
             
-            # 添加卖点图例
-            fig.add_trace(go.Scatter(
-                x=[None], y=[None],
-                mode='markers',
-                name='卖点',
-                marker=dict(size=12, color=self.colors['bsp_sell'], symbol='triangle-down', line=dict(width=2, color='white')),
-                showlegend=True
-            ))
+            if valid.size:
+                # 中枢角点：承载hover信息，与矩形同组显示/隐藏；编号沿用中枢在原列表中的序号
+                hover_info = np.empty((len(valid), 4), dtype=object)
+                hover_info[:, 0] = valid + 1
+                hover_info[:, 1] = y_low
+                hover_info[:, 2] = y_high
+                hover_info[:, 3] = np.where(zs_sure[valid], '确定', '不确定')
+                traces.append(dict(
+                    type='scatter',
+                    x=rect_x[:, :4].ravel(),
+                    y=rect_y[:, :4].ravel(),
+                    mode='markers',
+                    marker=dict(color=self.colors['zs'], size=6),
+                    customdata=np.repeat(hover_info, 4, axis=0),
+                    hovertemplate="中枢 %{customdata[0]}<br>范围: %{customdata[1]:.2f} - %{customdata[2]:.2f}<br>状态: %{customdata[3]}<extra></extra>",
+                    legendgroup='central_zone',
+                    showlegend=False
+                ))
+        
+        # 添加买卖点：所有买点合并为一条WebGL trace，所有卖点合并为一条WebGL trace
+        bsp_data = data.get('buy_sell_points')
+        if display.get('show_bsp', True) and bsp_data is not None and len(bsp_data['kl_idx']):
+            # 计算买卖点偏移量（整张图只需计算一次），远离K线
+            base_offset = self._calculate_price_offset(data['kline'])
             
-            # 添加买卖点类型图例
-            fig.add_trace(go.Scatter(
-                x=[None], y=[None],
-                mode='text',
-                name='一类买卖点',
-                textfont=dict(size=10, color='black'),
-                showlegend=True
-            ))
-            fig.add_trace(go.Scatter(
-                x=[None], y=[None],
-                mode='text', 
-                name='二类买卖点',
-                textfont=dict(size=10, color='black'),
-                showlegend=True
-            ))
-            fig.add_trace(go.Scatter(
-                x=[None], y=[None],
-                mode='text',
-                name='三类买卖点',
-                textfont=dict(size=10, color='black'),
-                showlegend=True
-            ))
+            # 用掩码将买卖点分到买/卖两组（超出K线范围的点直接丢弃）
+            all_kl_idx = np.asarray(bsp_data['kl_idx'])
+            all_is_buy = np.asarray(bsp_data['is_buy'], dtype=bool)
+            in_range = all_kl_idx < n_dates
             
-            # 添加具体的买卖点数据
-            for i, bsp in enumerate(data['buy_sell_points']):
-                # 将索引映射为日期
-                kl_idx = bsp['kl_idx']
-                if kl_idx < len(dates):
-                    x_date = dates[kl_idx]
-                    color = self.colors['bsp_buy'] if bsp['is_buy'] else self.colors['bsp_sell']
-                    symbol = 'triangle-up' if bsp['is_buy'] else 'triangle-down'
-                    label = '买' if bsp['is_buy'] else '卖'
-                    
-                    # 使用chan.py风格的买卖点显示
-                    bsp_type = bsp.get('type', '')
-                    marker_size, marker_symbol = self._get_bsp_marker_style(bsp_type, bsp['is_buy'])
-                    chan_style_label = self._get_bsp_chan_style_label(bsp_type, bsp['is_buy'])
-                    
-                    # 计算买卖点偏移位置，远离K线
-                    price_offset = self._calculate_price_offset(data['kline'], bsp['price'], bsp['is_buy'])
-                    
-                    # 添加买卖点标记
-                    fig.add_trace(go.Scatter(
-                        x=[x_date],
-                        y=[bsp['price'] + price_offset],
-                        mode='markers',
-                        marker=dict(size=marker_size, color=color, symbol=marker_symbol, line=dict(width=2, color='white')),
-                        hovertemplate=f"{label}点 ({bsp_type})<br>价格: {bsp['price']:.2f}<br>日期: %{{x}}<extra></extra>",
-                        showlegend=False
-                    ))
-                    
-                    # 添加买卖点文本标签（放在标记右侧）
-                    # 使用textposition控制位置，Plotly会自动处理偏移
-                    fig.add_trace(go.Scatter(
-                        x=[x_date],
-                        y=[bsp['price'] + price_offset],
-                        mode='text',
-                        text=[chan_style_label],
-                        textposition='middle right',  # 文本放在标记右侧
-                        textfont=dict(size=13, color='black', family='Arial Bold'),  # 黑色文字，更大字体
-                        showlegend=False
-                    ))
+            for is_buy in (True, False):
+                points = np.flatnonzero(in_range & (all_is_buy == is_buy))
+                if points.size == 0:
+                    continue
+                label = '买' if is_buy else '卖'
+                # 买点向下偏移，卖点向上偏移（远离K线主体）
+                price_offset = -base_offset if is_buy else base_offset
+                
+                # 使用chan.py风格的买卖点显示
+                types = [bsp_data['type'][i] or '' for i in points]
+                sizes = [self._get_bsp_marker_size(t) for t in types]
+                
+                # 直接使用chan.py的标签格式: b1, s2, b2,3b 等，类型缺失时显示 b? / s?
+                prefix = 'b' if is_buy else 's'
+                texts = [f"  {prefix}{t}" if t else f"{prefix}?" for t in types]
+                
+                kl_idx = all_kl_idx[points]
+                prices = np.asarray(bsp_data['price'], dtype=np.float64)[points]
+                
+                # 添加买卖点标记和文本标签（文本放在标记右侧），大小按买卖点类型逐点设置
+                traces.append(dict(
+                    type='scattergl',
+                    x=x_idx[kl_idx],
+                    y=prices + price_offset,
+                    mode='markers+text',
+                    name=f"{label}点",
+                    marker=dict(
+                        size=sizes,
+                        color=self.colors['bsp_buy'] if is_buy else self.colors['bsp_sell'],
+                        symbol='triangle-up' if is_buy else 'triangle-down',
+                        line=dict(width=2, color='white')
+                    ),
+                    text=texts,
+                    textposition='middle right',  # 文本放在标记右侧
+                    textfont=dict(size=13, color='black', family='Arial Bold'),  # 黑色文字，更大字体
+                    customdata=[[t, price, date] for t, price, date in zip(types, prices.tolist(), dates[kl_idx])],
+                    hovertemplate=f"{label}点 (%{{customdata[0]}})<br>价格: %{{customdata[1]:.2f}}<br>日期: %{{customdata[2]}}<extra></extra>",
+                    showlegend=True
+                ))
         
-        # 简洁布局 - 去掉多余控件，只保留主图和图例
+        # 布局只有标题随调用变化，其余部分复用初始化时构建的常量
         title_text = f"缠论分析 - {code}" if code else "缠论分析"
-        fig.update_layout(
-            title=dict(
-                text=title_text,
-                x=0.5,
-                font=dict(size=16, family="SimHei")
-            ),
-            xaxis=dict(
-                rangeslider=dict(visible=False),  # 去掉slide控件
-                type='category',
-                title="时间",
-                showgrid=False,
-                fixedrange=True  # 禁用缩放
-            ),
-            yaxis=dict(
-                title="价格",
-                showgrid=True,
-                gridcolor='lightgray',
-                fixedrange=True  # 禁用缩放
-            ),
-            height=600,
-            showlegend=True,
-            template='plotly_white',
-            hovermode='closest',
-            margin=dict(l=50, r=20, t=60, b=50),
-            plot_bgcolor='white',
-            paper_bgcolor='white'
-        )
+        layout = {
+            **self._base_layout,
+            'xaxis': {**self._base_layout['xaxis'], **self._date_ticks(x_idx, dates)},
+            # 同一代码刷新数据时保留用户的视图状态（图例显隐等），不重新布局
+            'uirevision': code,
+            'title': {'text': title_text, 'x': 0.5, 'font': {'size': 16, 'family': "SimHei"}}
+        }
         
-        # 去掉工具栏，只保留基本功能
-        fig.update_layout(
-            modebar=dict(
-                remove=['zoom2d', 'pan2d', 'select2d', 'lasso2d', 'zoomin2d', 'zoomout2d', 'autoScale2d', 'resetScale2d']
-            )
-        )
+        # 创建基础图形 - 单行显示，专注核心
+        # 数据均由内部生成，fast模式下跳过plotly属性校验
+        fig = go.Figure(data=traces, layout=layout, _validate=not self.fast)
         
         return fig
     
-    def _get_bsp_chan_style_label(self, bsp_type, is_buy):
-        """获取chan.py风格的买卖点标签"""
-        if not bsp_type:
-            return "b?" if is_buy else "s?"
+    def _build_kline_traces(self, kline_data, x_idx, dates):
+        """构建K线trace：数据量小时使用SVG蜡烛图，超过阈值时改用WebGL线段绘制"""
+        if len(dates) <= _WEBGL_KLINE_THRESHOLD:
+            return [dict(
+                type='candlestick',
+                x=np.asarray(x_idx, dtype=_WIRE_INT),
+                open=np.asarray(kline_data['open'], dtype=np.float64),
+                high=np.asarray(kline_data['high'], dtype=np.float64),
+                low=np.asarray(kline_data['low'], dtype=np.float64),
+                close=np.asarray(kline_data['close'], dtype=np.float64),
+                text=dates,  # 数值横轴下hover显示日期
+                hoverinfo='text+y',
+                name='K线',
+                increasing=dict(line=dict(color='red')),  # A股红色上涨
+                decreasing=dict(line=dict(color='green')),
+                showlegend=True
+            )]
+        
+        # WebGL模式：影线为low-high竖线，实体为open-close粗竖线，按涨跌拆成两组各两条trace
+        # 数据量大时逐K线hover命中检测开销很大，K线不响应hover，只保留稀疏的笔/线段/买卖点hover
+        x = np.asarray(x_idx, dtype=np.float64)
+        open_arr = np.asarray(kline_data['open'], dtype=np.float64)
+        high_arr = np.asarray(kline_data['high'], dtype=np.float64)
+        low_arr = np.asarray(kline_data['low'], dtype=np.float64)
+        close_arr = np.asarray(kline_data['close'], dtype=np.float64)
+        if len(x) > _KLINE_DOWNSAMPLE_TARGET:
+            x, open_arr, high_arr, low_arr, close_arr = _m4_downsample(
+                x, open_arr, high_arr, low_arr, close_arr, _KLINE_DOWNSAMPLE_TARGET)
+        rising = close_arr >= open_arr
+        # 实体宽度按K线数量估算，至少1像素
+        body_width = max(1, 1200 // len(x))
+        
+        traces = []
+        show_legend = True
+        for mask, color in ((rising, 'red'), (~rising, 'green')):  # A股红色上涨
+            idx = np.flatnonzero(mask)
+            if idx.size == 0:
+                continue
+            seg_x = _interleave_segments(x[idx], x[idx]).astype(_WIRE_FLOAT)
+            traces.append(dict(
+                type='scattergl',
+                x=seg_x,
+                y=_interleave_segments(low_arr[idx], high_arr[idx]),
+                mode='lines',
+                line=dict(color=color, width=1),
+                hoverinfo='skip',
+                name='K线',
+                legendgroup='kline',
+                showlegend=show_legend
+            ))
+            traces.append(dict(
+                type='scattergl',
+                x=seg_x,
+                y=_interleave_segments(open_arr[idx], close_arr[idx]),
+                mode='lines',
+                line=dict(color=color, width=body_width),
+                hoverinfo='skip',
+                name='K线',
+                legendgroup='kline',
+                showlegend=False
+            ))
+            show_legend = False
+        return traces
+    
+    def _group_lines_by_sure(self, lines, x_idx, dates, n_dates):
+        """将笔/线段的列式数组按is_sure分组，交错为 [起点, 终点, 间隔] 序列以断开相邻连线
         
-        # 直接使用chan.py的格式: b1, s2, b2,3b 等
-        prefix = "b" if is_buy else "s"
-        return f"  {prefix}{bsp_type}"
+        返回: {is_sure: (x_values, y_values, hover)}，hover每行为 [日期, 状态]，
+        没有数据的分组不出现在结果中
+        """
+        x0 = np.asarray(lines['x0'])
+        x1 = np.asarray(lines['x1'])
+        y0 = np.asarray(lines['y0'], dtype=np.float64)
+        y1 = np.asarray(lines['y1'], dtype=np.float64)
+        sure = np.asarray(lines['is_sure'], dtype=bool)
+        # 确保索引不超出K线范围
+        in_range = (x0 < n_dates) & (x1 < n_dates)
+        
+        result = {}
+        for is_sure in (True, False):
+            sel = np.flatnonzero(in_range & (sure == is_sure))
+            if sel.size == 0:
+                continue
+            s0, s1 = x0[sel], x1[sel]
+            # 横坐标按传输精度发送，间隔处的NaN在float32下同样有效；价格保持float64
+            xs = _interleave_segments(x_idx[s0].astype(np.float64), x_idx[s1].astype(np.float64)).astype(_WIRE_FLOAT)
+            ys = _interleave_segments(y0[sel], y1[sel])
+            hover = np.empty((len(xs), 2), dtype=object)
+            hover[:, 0] = _interleave_segments(dates[s0], dates[s1])
+            hover[:, 1] = "确定" if is_sure else "不确定"
+            hover[2::3, 1] = None
+            result[is_sure] = (xs, ys, hover)
+        return result
+    
+    def _date_ticks(self, x_idx, dates, max_ticks=10):
+        """数值横轴的刻度：按步长抽取约max_ticks个K线序号，标签显示对应日期"""
+        step = max(1, len(dates) // max_ticks)
+        return {
+            'tickmode': 'array',
+            'tickvals': x_idx[::step],
+            'ticktext': dates[::step]
+        }
     
-    def _get_bsp_marker_style(self, bsp_type, is_buy):
-        """根据买卖点类型获取chan.py风格的标记样式"""
+    def _get_bsp_marker_size(self, bsp_type):
+        """根据买卖点类型获取标记大小"""
         # chan.py使用统一的三角形标记，通过文本区分类型
-        # 这里我们保持一致的三角形样式，通过大小稍微区分
-        if '1' in bsp_type:
-            return 14, 'triangle-up' if is_buy else 'triangle-down'  # 一类买卖点稍大
-        elif '2' in bsp_type:
-            return 12, 'triangle-up' if is_buy else 'triangle-down'  # 二类买卖点标准
-        elif '3' in bsp_type:
-            return 10, 'triangle-up' if is_buy else 'triangle-down'  # 三类买卖点稍小
-        else:
-            return 12, 'triangle-up' if is_buy else 'triangle-down'  # 默认
+        # 这里我们保持一致的三角形样式，通过大小稍微区分；类型字符串以最低类别的数字开头，按首字符分派
+        return _BSP_SIZE_BY_CLASS.get(bsp_type[:1], _BSP_DEFAULT_SIZE)
     
-    def _calculate_price_offset(self, kline_data, price, is_buy):
+    def _calculate_price_offset(self, kline_data):
         """计算买卖点价格偏移量，使其远离K线"""
-        # 计算价格范围
-        min_price = min(kline_data['low'])
-        max_price = max(kline_data['high'])
-        price_range = max_price - min_price
+        low = np.asarray(kline_data['low'], dtype=np.float64)
+        high = np.asarray(kline_data['high'], dtype=np.float64)
+        
+        # 计算价格范围：有numba时走编译后的单次扫描，否则使用numpy向量化
+        if NUMBA_AVAILABLE:
+            price_range = float(_price_range(low, high))
+        else:
+            price_range = float(high.max() - low.min())
         
         # 计算偏移量（价格范围的5%）
         offset_percentage = 0.05
-        offset = price_range * offset_percentage
-        
-        # 买点向下偏移，卖点向上偏移（远离K线主体）
-        return -offset if is_buy else offset
-    
+        return price_range * offset_percentage
@@ -1,3 +1,7 @@
+import hashlib
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
 import streamlit as st
 from datetime import datetime
 from typing import Dict, Any
@@ -5,6 +9,47 @@ from .data_service import StreamlitDataService
 from .chart_render import PlotlyChartRenderer
 from .config_compiler import StreamlitConfig
 
+# 原始数据每页显示的行数：只向前端传输当前页，传输量与K线总数无关
+_RAW_PAGE_SIZE = 200
+
+# 只影响图表显示、不传给chan.py的参数，作为figure缓存键的一部分
+_DISPLAY_FLAGS = ('show_bi', 'show_seg', 'show_zs', 'show_bsp')
+
+# 局部重跑：片段内的控件变化只重跑该片段，不触发整页重跑和图表重新序列化
+# st.fragment 需要 streamlit 1.37+，1.33~1.36 使用 experimental_fragment，更早的版本退化为普通调用
+_fragment = getattr(st, 'fragment', None) or getattr(st, 'experimental_fragment', None) or (lambda func: func)
+
+
+def _hash_chart_data(data: Dict) -> str:
+    """计算图表数据的摘要：数值数组直接哈希内存，其余字段哈希其repr
+    
+    所有区块的每一列都参与计算，任何一列变化都会得到新的摘要
+    """
+    h = hashlib.blake2b(digest_size=16)
+    for key in ('kline', 'bi', 'segment', 'central_zone', 'buy_sell_points'):
+        value = data.get(key)
+        h.update(key.encode())
+        if isinstance(value, dict):
+            # 列式数据：逐列哈希，numpy数组的repr会省略中间元素，必须使用原始字节
+            for col in sorted(value):
+                arr = value[col]
+                h.update(col.encode())
+                h.update(arr.tobytes() if isinstance(arr, np.ndarray) else repr(arr).encode())
+        else:
+            h.update(repr(value).encode())
+    return h.hexdigest()
+
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def _build_figure(data_hash: str, code: str, level: str, display_flags: tuple,
+                  _renderer: PlotlyChartRenderer, _data: Dict) -> go.Figure:
+    """按数据摘要和显示开关缓存图表：数据和开关都未变的重跑不再重新构建figure
+    
+    下划线开头的参数不参与缓存键计算，数据内容已由data_hash代表；
+    st.cache_data每次返回反序列化的副本，某个会话修改figure不会影响其他会话
+    """
+    return _renderer.create_chan_chart(_data, level, code, display=dict(display_flags))
+
 
 class ChartService:
     """图表服务类，封装数据获取和图表生成逻辑"""
@@ -33,8 +78,9 @@ class ChartService:
                     end_date=end_date
                 )
                 
-                # 生成图表
-                fig = self.chart_renderer.create_chan_chart(data, level, code)
+                # 生成图表：显示开关只参与figure缓存键，不影响上面的数据缓存
+                display_flags = tuple((flag, chan_params.get(flag, True)) for flag in _DISPLAY_FLAGS)
+                fig = _build_figure(_hash_chart_data(data), code, level, display_flags, self.chart_renderer, data)
                 
                 # 存储会话数据
                 st.session_state.chart_figure = fig
@@ -49,6 +95,7 @@ class ChartService:
         """检查是否有图表数据"""
         return 'chart_figure' in st.session_state
     
+    @_fragment
     def display_chart(self):
         """显示图表"""
         if not self.has_chart():
@@ -60,13 +107,23 @@ class ChartService:
         
         st.subheader(f"📊 {code} - {level_options[selected_level]}")
         
+        # 静态模式下浏览器不再处理悬停和缩放，K线很多时页面更流畅
+        interactive = st.checkbox(
+            "交互式hover",
+            value=True,
+            key="chart_interactive",
+            help="关闭后图表为静态图像，不响应悬停和缩放"
+        )
+        
         st.plotly_chart(
             st.session_state.chart_figure,
             use_container_width=True,
             config={
                 'displayModeBar': False,
                 'displaylogo': False,
-                'staticPlot': False
+                'staticPlot': not interactive,
+                'doubleClickDelay': 100,
+                'responsive': True
             }
         )
     
@@ -75,6 +132,7 @@ class ChartService:
         if 'last_update' in st.session_state:
             st.caption(f"📅 最后更新: {st.session_state.last_update.strftime('%Y-%m-%d %H:%M:%S')}")
     
+    @_fragment
     def display_data_summary(self):
         """显示数据摘要"""
         if 'chart_data' not in st.session_state:
@@ -83,16 +141,46 @@ class ChartService:
         data = st.session_state.chart_data
         
         st.markdown("### 📊 数据概览")
-        col1, col2, col3, col4 = st.columns(4)
-        
-        with col1:
-            st.metric("📈 K线数量", len(data['kline']['dates']))
-        with col2:
-            st.metric("✏️ 笔数量", len(data.get('bi', [])))
-        with col3:
-            st.metric("🏛️ 中枢数量", len(data.get('central_zone', [])))
-        with col4:
-            st.metric("🎯 买卖点数量", len(data.get('buy_sell_points', [])))
+        # 四项统计合成一张表，只向前端发送一个元素
+        # 指标名作为索引显示，不依赖streamlit 1.23才有的hide_index参数
+        bi_data, zs_data, bsp_data = data.get('bi'), data.get('central_zone'), data.get('buy_sell_points')
+        st.dataframe(
+            pd.DataFrame(
+                {"数量": [
+                    len(data['kline']['dates']),
+                    len(bi_data['x0']) if bi_data is not None else 0,
+                    len(zs_data['x0']) if zs_data is not None else 0,
+                    len(bsp_data['kl_idx']) if bsp_data is not None else 0
+                ]},
+                index=pd.Index(["📈 K线", "✏️ 笔", "🏛️ 中枢", "🎯 买卖点"], name="指标")
+            )
+        )
         
         if st.checkbox("显示原始数据"):
-            st.json(data)
\ No newline at end of file
+            sections = (("📈 K线", 'kline'), ("✏️ 笔", 'bi'), ("📏 线段", 'segment'),
+                        ("🏛️ 中枢", 'central_zone'), ("🎯 买卖点", 'buy_sell_points'))
+            for label, key in sections:
+                if data.get(key) is None:
+                    continue
+                with st.expander(label):
+                    # 各部分均为等长的列式数据，可直接构建DataFrame
+                    self._display_paged_table(pd.DataFrame(data[key]), key)
+    
+    def _display_paged_table(self, df: pd.DataFrame, key: str):
+        """分页显示表格"""
+        total = len(df)
+        if total == 0:
+            st.caption("无数据")
+            return
+        
+        offset = st.number_input(
+            "起始行",
+            min_value=0,
+            max_value=total - 1,
+            value=0,
+            step=_RAW_PAGE_SIZE,
+            key=f"raw_offset_{key}"
+        )
+        end = min(offset + _RAW_PAGE_SIZE, total)
+        st.caption(f"第 {offset + 1} - {end} 行，共 {total} 行")
+        st.dataframe(df.iloc[offset:end], use_container_width=True)
\ No newline at end of file
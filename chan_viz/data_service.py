@@ -1,482 +1,551 @@
 import streamlit as st
+import numpy as np
+import hashlib
+import importlib
+import operator
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from types import MappingProxyType
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import nullcontext
 from datetime import datetime
-from typing import Dict
+from itertools import chain
+from pathlib import Path
+from typing import Dict, List, Tuple
 import sys
-import os
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 
-# 兼容处理: 先检查Python版本，再尝试导入chan.py
-try:
-    import sys
-    import subprocess
-    
-    # 检查Python版本
-    if sys.version_info < (3, 11):
-        CHAN_AVAILABLE = False
-        CHAN_IMPORT_ERROR = f"Python版本过低，需要3.11+，当前为{sys.version_info.major}.{sys.version_info.minor}"
-    else:
-        chan_path = os.path.join(os.path.dirname(__file__), '..', 'chan.py')
-        sys.path.insert(0, chan_path)  # 插入到开头确保优先加载
-        from Chan import CChan
-        from ChanConfig import CChanConfig
-        CHAN_AVAILABLE = True
-        CHAN_IMPORT_ERROR = None
-        
-except Exception as e:
-    CHAN_AVAILABLE = False
-    CHAN_IMPORT_ERROR = str(e)
+# chan.py在首次加载数据时才导入：导入开销较大，而应用启动和页面渲染并不需要它
+_CHAN_PATH = Path(__file__).resolve().parent.parent / 'chan.py'
+# None表示尚未尝试导入；导入后为 {'CChan', 'CChanConfig', 'DATA_SRC', 'KL_TYPE', 'LEVELS'} 名称到对象的字典，不可用时为False
+_chan_module = None
+CHAN_AVAILABLE = None  # 首次尝试导入前未知
+CHAN_IMPORT_ERROR = None
 
-# 定义核心数据函数，修复缓存问题
-@st.cache_data(ttl=3600)
-def load_chan_data(code: str, level: str, config: Dict, start_date: str = None, end_date: str = None) -> Dict:
-    """加载缠论数据并转换为前端格式"""
-    
-    # 参数验证
-    if not code or not level:
-        raise ValueError("参数缺失")
-    
-    # 转换股票代码格式：UI的.SZ/.SH格式 -> BaoStock的sz./sh.格式
-    if code.endswith('.SZ'):
-        baostock_code = f"sz.{code[:-3]}"
-    elif code.endswith('.SH'):
-        baostock_code = f"sh.{code[:-3]}"
-    else:
-        # 如果已经是BaoStock格式，直接使用
-        baostock_code = code
-    
-    # 设置默认日期范围
-    if not start_date:
-        start_date = "2023-01-01"
-    if not end_date:
-        end_date = datetime.now().strftime("%Y-%m-%d")
-    
-    # 确保chan.py可用
-    if not CHAN_AVAILABLE:
-        raise RuntimeError(f"chan.py不可用: {CHAN_IMPORT_ERROR}")
-    
-    # 构建配置
-    chan_config = CChanConfig(config)
-    
-    try:
-        # 加载真实数据
-        chan = CChan(
-            code=baostock_code,  # 使用转换后的代码格式
-            begin_time=start_date,
-            end_time=end_date,
-            data_src="BAO_STOCK",
-            lv_list=[level],
-            config=chan_config
-        )
-        return _convert_to_visualization_data(chan, level)
-            
-    except Exception as e:
-        print(f"数据加载错误: {e}")
-        raise RuntimeError(f"无法获取股票数据，请检查股票代码和网络连接: {e}")
+# UI中可选的级别名称，导入chan.py时一次性映射为KL_TYPE枚举
+_LEVEL_NAMES = ("K_DAY", "K_60M", "K_30M", "K_15M", "K_5M", "K_1M")
 
-@st.cache_data(ttl=3600)
-def _convert_to_visualization_data(chan, level):
-    """转换为可视化格式"""
-    try:
-        kline_data = chan[level]
-        return {
-            "kline": _extract_kline_data(kline_data),
-            "bi": _extract_bi_data(getattr(kline_data, 'bi_list', [])),
-            "segment": _extract_segment_data(getattr(kline_data, 'seg_list', [])),
-            "central_zone": _extract_zs_data(getattr(kline_data, 'zs_list', [])),
-            "buy_sell_points": _extract_bsp_data(getattr(kline_data, 'bs_point_lst', []))
-        }
-    except:
-        return _get_mock_data()
+# UI中的A股代码格式，如 000001.SZ / 600000.SH
+_STOCK_CODE_RE = re.compile(r'^(.+)\.(SZ|SH)$')
 
-@st.cache_data(ttl=3600)
-def _extract_kline_data(kline_data):
-    """提取K线数据"""
-    dates = []
-    open_price, close_price, low, high, volume = [], [], [], [], []
-    
-    try:
-        for kl in kline_data:
-            for klu in kl:
-                dates.append(str(klu.time))
-                open_price.append(float(klu.open))
-                close_price.append(float(klu.close))
-                low.append(float(klu.low))
-                high.append(float(klu.high))
-                volume.append(float(getattr(klu, 'volume', 0)))
-    except:
-        # 模拟数据
-        import random
-        from datetime import datetime, timedelta
-        dates = [(datetime.now() - timedelta(days=i)).strftime('%Y-%m-%d') for i in range(20)]
-        dates.reverse()
-        base_price = 100
-        
-        for i in range(20):
-            open_p = base_price + random.uniform(-3, 3)
-            close_p = open_p + random.uniform(-2, 2)
-            high_p = max(open_p, close_p) + random.uniform(0, 1.5)
-            low_p = min(open_p, close_p) - random.uniform(0, 1.5)
-            
-            open_price.append(round(open_p, 2))
-            close_price.append(round(close_p, 2))
-            low.append(round(low_p, 2))
-            high.append(round(high_p, 2))
-            volume.append(random.randint(1000, 10000))
-            base_price = close_p
-    
-    return {
-        "dates": dates,
-        "open": open_price,
-        "close": close_price,
-        "low": low,
-        "high": high,
-        "volume": volume
-    }
+# K线单元的时间字段，及按此顺序一次取出的价格字段
+_KLU_TIME = operator.attrgetter('time')
+_KLU_OHLC = operator.attrgetter('open', 'close', 'low', 'high')
 
-@st.cache_data(ttl=3600)
-def _extract_bi_data(bi_list):
-    """提取笔数据"""
-    bi_coords = []
-    try:
-        for bi in bi_list:
-            # 修复：使用begin_klc和end_klc的idx
-            bi_coords.append({
-                "x": [int(bi.begin_klc.idx), int(bi.end_klc.idx)],
-                "y": [float(bi.begin_klc.close), float(bi.end_klc.close)],
-                "type": str(getattr(bi, 'type', '笔')),
-                "direction": "up" if getattr(bi, 'dir', 1) > 0 else "down"
-            })
-    except:
-        # 模拟数据
-        bi_coords = [
-            {"x": [0, 5], "y": [100, 105], "type": "上升笔", "direction": "up"},
-            {"x": [5, 10], "y": [105, 98], "type": "下降笔", "direction": "down"}
-        ]
-    return bi_coords
+# 买卖点类型组合 -> type2str()结果：买卖点类型只有少数几种组合，无需逐点拼接字符串
+_BSP_TYPE_STR_CACHE: Dict = {}
+
+# 未指定起始日期时的默认值
+_DEFAULT_START_DATE = "2023-01-01"
+
+# BaoStock使用进程内全局单连接，登录和取数都不是线程安全的，同一时间只允许一个BaoStock加载
+_BAOSTOCK_LOCK = threading.Lock()
+
+# 截止到今天的区间在进程内保留的CChan对象数量上限，超出时淘汰最久未使用的
+_LIVE_CHAN_LIMIT = 4
+# 截止到今天的区间：{(代码, 级别, 配置, 起始日期): CChan}，按最近使用排序；
+# 各会话和load_many的工作线程共用，读写需持 _LIVE_CHANS_LOCK，取出的CChan归当前线程独占
+_LIVE_CHANS = OrderedDict()
+_LIVE_CHANS_LOCK = threading.Lock()
+# 截止到今天的区间的结果缓存时间：期间的重跑直接返回缓存，过期后才拉取新增K线
+_LIVE_CACHE_TTL = 60  # 秒
 
-@st.cache_data(ttl=3600)
-def _extract_zs_data(zs_list):
-    """提取中枢数据"""
-    zones = []
+# 可视化数据的磁盘缓存：进程重启后st.cache_data失效，命中磁盘缓存可省去重新拉取数据和计算
+# 只缓存截止日期早于今天的历史区间，数据不再变化；环境变量 CHAN_VIZ_CACHE_DIR 可指定目录，设为空字符串时不使用磁盘缓存
+_DISK_CACHE_DIR = os.environ.get('CHAN_VIZ_CACHE_DIR', str(Path.home() / '.chan_viz_cache'))
+_DISK_CACHE_DIR = Path(_DISK_CACHE_DIR) if _DISK_CACHE_DIR else None
+_DISK_CACHE_TTL = 24 * 3600  # 秒
+# 可视化数据的格式版本，参与缓存文件名计算：转换逻辑或字段变化时递增，旧格式的文件不再命中，过期后被清理
+_CACHE_VERSION = 1
+
+def _cache_path(code: str, level: str, start_date: str, end_date: str, cfg_key: tuple):
+    """按加载参数生成磁盘缓存文件路径，未启用磁盘缓存时返回None"""
+    if _DISK_CACHE_DIR is None:
+        return None
+    digest = hashlib.blake2b(repr((_CACHE_VERSION, code, level, start_date, end_date, cfg_key)).encode(),
+                             digest_size=16).hexdigest()
+    return _DISK_CACHE_DIR / f"{digest}.npz"
+
+def _unlink_quietly(path: Path):
+    """删除缓存文件，文件已不存在或无法删除时忽略"""
     try:
-        for zs in zs_list:
-            # 修复：使用正确的中枢属性
-            zones.append({
-                "x": [int(zs.begin.idx), int(zs.end.idx)],
-                "y": [float(zs.low), float(zs.high)],
-                "type": str(getattr(zs, 'type', '中枢'))
-            })
-    except:
-        # 模拟数据
-        zones = [
-            {"x": [3, 8], "y": [98, 102], "type": "中枢"}
-        ]
-    return zones
+        path.unlink()
+    except OSError:
+        pass
 
-@st.cache_data(ttl=3600)
-def _extract_segment_data(seg_list):
-    """提取线段数据"""
-    segments = []
+def _read_disk_cache(path):
+    """读取未过期的磁盘缓存，不存在、过期或损坏时返回None；过期和损坏的文件直接删除"""
+    if path is None:
+        return None
     try:
-        for seg in seg_list:
-            # 修复：使用正确的线段属性
-            segments.append({
-                "x": [int(seg.begin_klc.idx), int(seg.end_klc.idx)],
-                "y": [float(seg.begin_klc.close), float(seg.end_klc.close)],
-                "type": str(getattr(seg, 'type', '线段'))
-            })
-    except:
-        segments = []
-    return segments
+        if time.time() - path.stat().st_mtime > _DISK_CACHE_TTL:
+            _unlink_quietly(path)
+            return None
+        with np.load(path) as npz:
+            list_keys = set(npz['__lists__'].tolist())
+            data = {}
+            for name in npz.files:
+                if name == '__lists__':
+                    continue
+                section, column = name.split('.', 1)
+                value = npz[name]
+                data.setdefault(section, {})[column] = value.tolist() if name in list_keys else value
+        return data
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        # 截断或损坏的文件（如zipfile.BadZipFile）删除后按未命中处理，下次加载时重新写入
+        print(f"读取磁盘缓存失败，已删除: {e}")
+        _unlink_quietly(path)
+        return None
 
-@st.cache_data(ttl=3600)
-def _extract_bsp_data(bsp_list):
-    """提取买卖点数据"""
-    bsp_data = []
+def _prune_disk_cache(cache_dir: Path):
+    """删除目录中已过期的缓存文件，包括写入中途失败留下的临时文件"""
+    expire_before = time.time() - _DISK_CACHE_TTL
     try:
-        for bsp in bsp_list:
-            bsp_data.append({
-                "kl_idx": int(bsp.klu.idx),
-                "price": float(bsp.bi.get_end_val()),
-                "is_buy": bool(bsp.is_buy),
-                "type": str(getattr(bsp, 'type', '买卖点'))
-            })
-    except:
-        # 模拟数据
-        bsp_data = [
-            {"kl_idx": 12, "price": 103, "is_buy": True, "type": "买点"},
-            {"kl_idx": 18, "price": 98, "is_buy": False, "type": "卖点"}
-        ]
-    return bsp_data
+        with os.scandir(cache_dir) as entries:
+            for entry in entries:
+                if entry.name.endswith('.npz') and entry.stat().st_mtime < expire_before:
+                    _unlink_quietly(Path(entry.path))
+    except OSError:
+        pass
 
-@st.cache_data(ttl=3600)
-def _get_mock_data():
-    """获取模拟数据"""
-    import random
-    from datetime import datetime, timedelta
+def _write_disk_cache(path, data: Dict):
+    """将可视化数据按 区块.列名 写入npz；字符串列存为定长unicode数组，读取时无需pickle
     
-    # 生成模拟K线数据
-    dates = [(datetime.now() - timedelta(days=i)).strftime('%Y-%m-%d') for i in range(15)]
-    dates.reverse()
-    base_price = 100
-    open_price, close_price, low, high = [], [], [], []
+    写入后顺带清理目录中的过期文件，不再请求的参数组合不会一直占用磁盘
+    """
+    if path is None:
+        return
+    arrays = {}
+    list_keys = []
+    for section, columns in data.items():
+        for column, value in columns.items():
+            name = f"{section}.{column}"
+            if isinstance(value, list):
+                list_keys.append(name)
+            arrays[name] = np.asarray(value)
+    arrays['__lists__'] = np.asarray(list_keys, dtype=str)
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # 先写临时文件再替换，避免并发加载时读到写了一半的文件
+        tmp_path = path.with_name(f"{path.stem}.{os.getpid()}.{threading.get_ident()}.tmp.npz")
+        np.savez_compressed(tmp_path, **arrays)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"写入磁盘缓存失败: {e}")
+        return
+    _prune_disk_cache(path.parent)
+
+def _load_chan() -> bool:
+    """导入chan.py（每个进程只尝试一次），返回是否可用"""
+    global _chan_module, CHAN_AVAILABLE, CHAN_IMPORT_ERROR
+    if _chan_module is not None:
+        return CHAN_AVAILABLE
     
-    for i in range(15):
-        open_p = base_price + random.uniform(-2, 2)
-        close_p = open_p + random.uniform(-1.5, 1.5)
-        high_p = max(open_p, close_p) + random.uniform(0, 1)
-        low_p = min(open_p, close_p) - random.uniform(0, 1)
-        
-        open_price.append(round(open_p, 2))
-        close_price.append(round(close_p, 2))
-        low.append(round(low_p, 2))
-        high.append(round(high_p, 2))
-        base_price = close_p
+    # 兼容处理: 先检查Python版本，再尝试导入chan.py
+    if sys.version_info < (3, 11):
+        CHAN_IMPORT_ERROR = f"Python版本过低，需要3.11+，当前为{sys.version_info.major}.{sys.version_info.minor}"
+        _chan_module = False
+    else:
+        chan_path = str(_CHAN_PATH)
+        if chan_path not in sys.path:
+            sys.path.insert(0, chan_path)  # 插入到开头确保优先加载
+        try:
+            enums = importlib.import_module('Common.CEnum')
+            _chan_module = {
+                'CChan': importlib.import_module('Chan').CChan,
+                'CChanConfig': importlib.import_module('ChanConfig').CChanConfig,
+                'DATA_SRC': enums.DATA_SRC,
+                'KL_TYPE': enums.KL_TYPE,
+                # 级别字符串 -> KL_TYPE枚举
+                'LEVELS': MappingProxyType({name: enums.KL_TYPE[name] for name in _LEVEL_NAMES})
+            }
+        except Exception as e:
+            CHAN_IMPORT_ERROR = str(e)
+            _chan_module = False
     
-    return {
-        "kline": {
-            "dates": dates,
-            "open": open_price,
-            "close": close_price,
-            "low": low,
-            "high": high
-        },
-        "bi": [
-            {"x": [0, 3], "y": [100, 102], "type": "上升笔", "direction": "up"},
-            {"x": [3, 7], "y": [102, 98], "type": "下降笔", "direction": "down"},
-            {"x": [7, 12], "y": [98, 101], "type": "上升笔", "direction": "up"}
-        ],
-        "central_zone": [
-            {"x": [4, 8], "y": [99, 101], "type": "中枢"}
-        ],
-        "segment": [
-            {"x": [0, 12], "y": [100, 101], "type": "线段"}
-        ],
-        "buy_sell_points": [
-            {"kl_idx": 12, "price": 101, "is_buy": True, "type": "买点"},
-            {"kl_idx": 14, "price": 100.5, "is_buy": False, "type": "卖点"}
-        ]
-    }
+    CHAN_AVAILABLE = bool(_chan_module)
+    if not CHAN_AVAILABLE:
+        print(f"⚠️ chan.py依赖不可用: {CHAN_IMPORT_ERROR}")
+    return CHAN_AVAILABLE
 
 class StreamlitDataService:
     """Streamlit专用的缠论数据服务"""
     
-    def __init__(self):
-        self.chan_available = CHAN_AVAILABLE
-        self.chan_error = CHAN_IMPORT_ERROR
-        if not CHAN_AVAILABLE:
-            print(f"⚠️ chan.py依赖不可用，将使用模拟数据: {CHAN_IMPORT_ERROR}")
+    @property
+    def chan_available(self) -> bool:
+        """chan.py是否可用，首次访问时才导入"""
+        return _load_chan()
     
-    @st.cache_data(ttl=3600)
-    def load_chan_data(_self, code: str, level: str, config: Dict, start_date: str = None, end_date: str = None) -> Dict:
-        """加载缠论数据并转换为前端格式"""
+    @property
+    def chan_error(self):
+        """chan.py不可用的原因"""
+        _load_chan()
+        return CHAN_IMPORT_ERROR
+    
+    def load_chan_data(self, code: str, level: str, config: Dict, start_date: str = None, end_date: str = None) -> Dict:
+        """加载缠论数据并转换为前端格式
         
-        # 参数验证
-        if not code or not level:
-            raise ValueError("参数缺失")
+        配置在此处转为排序后的元组作为缓存键，既避免每次哈希dict，也不受键顺序影响。
+        截止日期早于今天的历史区间数据不再变化，走st.cache_data缓存；截止到今天的区间K线仍在增加，
+        缓存时间缩短为 _LIVE_CACHE_TTL，过期后复用进程内保留的CChan对象，只拉取最后一根K线之后的新K线
+        """
+        cfg_key = tuple(sorted(config.items()))
         
-        # 转换股票代码格式：处理股票和加密货币
+        # 设置默认日期范围
+        today = datetime.now().date().isoformat()
+        if not start_date:
+            start_date = _DEFAULT_START_DATE
+        if not end_date:
+            end_date = today
+        
+        if end_date < today:
+            return self._load_chan_data(code, level, cfg_key, start_date, end_date)
+        return self._load_live_chan_data(code, level, cfg_key, start_date, end_date)
+    
+    def load_many(self, codes: List[str], level: str, config: Dict, start_date: str = None, end_date: str = None) -> Tuple[Dict[str, Dict], Dict[str, str]]:
+        """并发加载多个代码的缠论数据
+        
+        线程池随调用创建和关闭，不在会话之间共享；工作线程只访问带锁的进程级状态，不读写session_state
+        返回: ({code: 可视化数据}, {code: 失败原因})
+        """
+        # 工作线程需要挂上当前脚本的运行上下文，st.cache_data才能正常工作
+        ctx = get_script_run_ctx()
+        results, errors = {}, {}
+        with ThreadPoolExecutor(max_workers=min(8, max(len(codes), 1)), thread_name_prefix="chan_load") as executor:
+            futures = {
+                executor.submit(self._load_in_worker, ctx, code, level, config, start_date, end_date): code
+                for code in codes
+            }
+            for future in as_completed(futures):
+                code = futures[future]
+                try:
+                    results[code] = future.result()
+                except Exception as e:
+                    print(f"加载 {code} 失败: {e}")
+                    errors[code] = str(e)
+        return results, errors
+    
+    def _load_in_worker(self, ctx, code, level, config, start_date, end_date):
+        """在线程池中加载单个代码：CCXT并发执行，BaoStock由_fetch_lock串行"""
+        if ctx is not None:
+            add_script_run_ctx(threading.current_thread(), ctx)
+        return self.load_chan_data(code, level, config, start_date, end_date)
+    
+    def _resolve_code(self, code: str):
+        """转换代码格式并识别数据源
+        
+        返回: (chan.py使用的代码, 数据源名称)
+        """
         # 股票代码格式转换：UI的.SZ/.SH格式 -> BaoStock的sz./sh.格式
-        if code.endswith('.SZ'):
-            baostock_code = f"sz.{code[:-3]}"
-            data_source = "BAO_STOCK"
-        elif code.endswith('.SH'):
-            baostock_code = f"sh.{code[:-3]}"
-            data_source = "BAO_STOCK"
+        m = _STOCK_CODE_RE.match(code)
+        if m:
+            return f"{m.group(2).lower()}.{m.group(1)}", "BAO_STOCK"
         # 加密货币代码识别
-        elif code.upper() in ['BTC/USDT', 'ETH/USDT', 'BTC/USD', 'ETH/USD']:
-            baostock_code = code  # 直接使用原代码
-            data_source = "CCXT"
-        elif code.upper() in ['BTC', 'ETH']:
+        if code.upper() in ['BTC/USDT', 'ETH/USDT', 'BTC/USD', 'ETH/USD']:
+            return code, "CCXT"  # 直接使用原代码
+        if code.upper() in ['BTC', 'ETH']:
             # 自动补充交易对格式
-            baostock_code = f"{code.upper()}/USDT"
-            data_source = "CCXT"
-        else:
-            # 默认使用BaoStock格式
-            baostock_code = code
-            data_source = "BAO_STOCK"
+            return f"{code.upper()}/USDT", "CCXT"
+        # 默认使用BaoStock格式
+        return code, "BAO_STOCK"
+    
+    def _fetch_lock(self, data_source: str):
+        """拉取K线时需要持有的锁：BaoStock全局串行，其他数据源返回空上下文可并发"""
+        return _BAOSTOCK_LOCK if data_source == "BAO_STOCK" else nullcontext()
+    
+    def _resolve_request(self, code: str, level: str):
+        """校验参数并解析代码、数据源和级别
         
-        # 设置默认日期范围
-        if not start_date:
-            start_date = "2023-01-01"
-        if not end_date:
-            end_date = datetime.now().strftime("%Y-%m-%d")
+        返回: (chan.py使用的代码, 数据源名称, KL_TYPE枚举)
+        """
+        # 参数验证
+        if not code or not level:
+            raise ValueError("参数缺失")
         
         # 确保chan.py可用
-        if not _self.chan_available:
-            raise RuntimeError(f"chan.py不可用: {_self.chan_error}")
+        if not self.chan_available:
+            raise RuntimeError(f"chan.py不可用: {self.chan_error}")
         
-        # 导入枚举类型
-        from Common.CEnum import DATA_SRC, KL_TYPE
+        # 转换股票代码格式：处理股票和加密货币
+        baostock_code, data_source = self._resolve_code(code)
         
         # 转换级别字符串为KL_TYPE枚举
-        level_mapping = {
-            "K_DAY": KL_TYPE.K_DAY,
-            "K_60M": KL_TYPE.K_60M,
-            "K_30M": KL_TYPE.K_30M,
-            "K_15M": KL_TYPE.K_15M,
-            "K_5M": KL_TYPE.K_5M,
-            "K_1M": KL_TYPE.K_1M
-        }
-        
-        kl_type = level_mapping.get(level, KL_TYPE.K_DAY)
-        
-        # 构建配置
-        chan_config = CChanConfig(config)
+        kl_type = _chan_module['LEVELS'].get(level, _chan_module['KL_TYPE'].K_DAY)
+        return baostock_code, data_source, kl_type
+    
+    def _build_chan(self, baostock_code: str, data_source: str, kl_type, cfg_key: tuple, start_date: str, end_date: str):
+        """拉取K线并构建CChan对象"""
+        # 记录详细信息用于调试
+        print(f"加载数据: code={baostock_code}, level={kl_type}, source={data_source}")
+        print(f"时间范围: {start_date} to {end_date}")
         
-        try:
-            # 记录详细信息用于调试
-            print(f"加载数据: code={baostock_code}, level={kl_type}, source={data_source}")
-            print(f"时间范围: {start_date} to {end_date}")
-            
-            # 加载真实数据
-            chan = CChan(
+        # CChan在构造时拉取K线，BaoStock需持锁
+        with self._fetch_lock(data_source):
+            return _chan_module['CChan'](
                 code=baostock_code,  # 使用转换后的代码格式
                 begin_time=start_date,
                 end_time=end_date,
-                data_src=DATA_SRC[data_source],
+                data_src=_chan_module['DATA_SRC'][data_source],
                 lv_list=[kl_type],
-                config=chan_config
+                config=_chan_module['CChanConfig'](dict(cfg_key))
             )
-            return _self._convert_to_visualization_data(chan, kl_type)
+    
+    @st.cache_data(ttl=3600, max_entries=32)
+    def _load_chan_data(_self, code: str, level: str, cfg_key: tuple, start_date: str, end_date: str) -> Dict:
+        """历史区间的缓存实现，cfg_key为排序后的配置项元组
+        
+        只依赖参数、不读写session_state，缓存命中与否结果一致；
+        截止日期早于今天的数据不再变化，内存缓存过期后仍可使用磁盘缓存
+        """
+        baostock_code, data_source, kl_type = _self._resolve_request(code, level)
+        
+        try:
+            # 进程重启后内存缓存为空，先尝试磁盘缓存
+            disk_path = _cache_path(baostock_code, level, start_date, end_date, cfg_key)
+            data = _read_disk_cache(disk_path)
+            if data is not None:
+                print(f"命中磁盘缓存: {disk_path.name}")
+                return data
+            
+            # 加载真实数据
+            chan = _self._build_chan(baostock_code, data_source, kl_type, cfg_key, start_date, end_date)
+            data = _self._convert_to_visualization_data(chan, kl_type)
+            _write_disk_cache(disk_path, data)
+            return data
+                
+        except Exception as e:
+            print(f"数据加载错误: {e}")
+            raise RuntimeError(f"无法获取股票数据，请检查股票代码和网络连接: {e}")
+    
+    @st.cache_data(ttl=_LIVE_CACHE_TTL, max_entries=16)
+    def _load_live_chan_data(_self, code: str, level: str, cfg_key: tuple, start_date: str, end_date: str) -> Dict:
+        """截止到今天的区间：短时缓存结果，未命中时复用进程内保留的CChan对象只加载新增K线
+        
+        最多保留 _LIVE_CHAN_LIMIT 个CChan对象，按最近使用顺序淘汰；
+        同一区间的CChan正被其他线程使用时，当前线程重新构建
+        """
+        baostock_code, data_source, kl_type = _self._resolve_request(code, level)
+        
+        try:
+            chan_key = (baostock_code, level, cfg_key, start_date)
+            with _LIVE_CHANS_LOCK:
+                chan = _LIVE_CHANS.pop(chan_key, None)
+            if chan is not None:
+                with _self._fetch_lock(data_source):
+                    loaded = _self._load_new_klines(chan, kl_type, end_date)
+                if not loaded:
+                    chan = None
+            if chan is None:
+                chan = _self._build_chan(baostock_code, data_source, kl_type, cfg_key, start_date, end_date)
+            data = _self._convert_to_visualization_data(chan, kl_type)
+            
+            # 转换完成后再放回末尾表示最近使用，超出上限时淘汰最久未使用的
+            with _LIVE_CHANS_LOCK:
+                _LIVE_CHANS[chan_key] = chan
+                while len(_LIVE_CHANS) > _LIVE_CHAN_LIMIT:
+                    _LIVE_CHANS.popitem(last=False)
+            return data
                 
         except Exception as e:
             print(f"数据加载错误: {e}")
             raise RuntimeError(f"无法获取股票数据，请检查股票代码和网络连接: {e}")
     
+    def _load_new_klines(self, chan, kl_type, end_date):
+        """从已有CChan对象的最后一根K线开始拉取，增量喂入之后的新K线
+        
+        返回: 是否成功；失败时由调用方重新构建CChan
+        """
+        try:
+            kline_list = chan.kl_datas[kl_type]
+            if len(kline_list) == 0:
+                return False
+            last_time = kline_list[-1].lst[-1].time
+            begin_date = f"{last_time.year:04d}-{last_time.month:02d}-{last_time.day:02d}"
+            
+            # 从最后一根K线所在日期重新拉取，丢弃已处理过的K线
+            stockapi_cls = chan.GetStockAPI()
+            stockapi_cls.do_init()
+            try:
+                stockapi = stockapi_cls(code=chan.code, k_type=kl_type, begin_date=begin_date,
+                                        end_date=end_date, autype=chan.autype)
+                new_klus = [klu for klu in stockapi.get_kl_data() if klu.time.ts > last_time.ts]
+            finally:
+                stockapi_cls.do_close()
+            
+            if new_klus:
+                chan.trigger_load({kl_type: new_klus})
+            print(f"增量加载: 新增{len(new_klus)}根K线 ({begin_date} -> {end_date})")
+            return True
+        except Exception as e:
+            print(f"增量加载失败，重新计算: {e}")
+            return False
+    
     def _convert_to_visualization_data(self, chan, level):
         """转换为可视化格式"""
         try:
-            # 获取对应级别的K线列表
+            # 获取对应级别的K线列表，只查找一次
             kline_list = chan.kl_datas[level]
             
-            # 构建K线单元全局索引映射
-            klu_global_index_map = self._build_klu_index_mapping(kline_list)
-            
+            # 笔、线段、中枢的端点K线单元自带全局idx，无需再遍历合并K线构建索引映射
             return {
                 "kline": self._extract_kline_data(kline_list),
-                "bi": self._extract_bi_data(kline_list.bi_list, klu_global_index_map),
-                "segment": self._extract_segment_data(kline_list.seg_list, klu_global_index_map),
-                "central_zone": self._extract_zs_data(kline_list.zs_list, klu_global_index_map),
+                "bi": self._extract_bi_data(kline_list.bi_list),
+                "segment": self._extract_segment_data(kline_list.seg_list),
+                "central_zone": self._extract_zs_data(kline_list.zs_list),
                 "buy_sell_points": self._extract_bsp_data(kline_list.bs_point_lst)
             }
         except Exception as e:
             raise RuntimeError(f"数据转换失败: {e}")
     
-    def _build_klu_index_mapping(self, kline_list):
-        """构建K线单元全局索引映射
+    def _extract_kline_data(self, kline_list):
+        """提取K线数据
         
-        返回: {klc_idx: (start_klu_idx, end_klu_idx)}
+        先将所有K线单元展平为一个列表，K线数量已知，价格直接写入预分配的 (n, 4) float64 缓冲区，
+        不再经过逐行元组和按列转置的中间列表
         """
-        klu_global_index_map = {}
-        total_klu_count = 0
+        # 遍历K线合并单元中的每个K线单元
+        klus = [klu for kline_combine in kline_list for klu in kline_combine.lst]
+        n = len(klus)
         
-        for klc_idx, klc in enumerate(kline_list):
-            start_klu_idx = total_klu_count
-            klc_klu_count = len(klc.lst)
-            end_klu_idx = start_klu_idx + klc_klu_count - 1
-            
-            klu_global_index_map[klc_idx] = (start_klu_idx, end_klu_idx)
-            total_klu_count += klc_klu_count
-        
-        return klu_global_index_map
-    
-    def _extract_kline_data(self, kline_list):
-        """提取K线数据"""
-        dates = []
-        open_price, close_price, low, high, volume = [], [], [], [], []
+        # attrgetter在C层一次取出四个价格，fromiter按已知长度逐个写入，转置后每列为同一块内存中的连续行
+        ohlc = np.fromiter(chain.from_iterable(map(_KLU_OHLC, klus)),
+                           dtype=np.float64, count=4 * n).reshape(n, 4).T.copy()
         
-        # 遍历K线合并单元
-        for kline_combine in kline_list:
-            # 遍历合并单元中的每个K线单元
-            for klu in kline_combine.lst:
-                dates.append(str(klu.time))
-                open_price.append(float(klu.open))
-                close_price.append(float(klu.close))
-                low.append(float(klu.low))
-                high.append(float(klu.high))
-                volume.append(float(getattr(klu, 'volume', 0)))
+        # 成交量并非所有数据源的K线单元都有：只检查首个单元，没有时不再逐个getattr遍历一遍
+        if n and hasattr(klus[0], 'volume'):
+            volume = np.fromiter((klu.volume for klu in klus), dtype=np.float64, count=n)
+        else:
+            volume = np.zeros(n, dtype=np.float64)
         
+        # 数值序列为numpy数组，图表序列化时无需逐个处理Python float
         return {
-            "dates": dates,
-            "open": open_price,
-            "close": close_price,
-            "low": low,
-            "high": high,
+            "dates": list(map(str, map(_KLU_TIME, klus))),
+            "idx": np.arange(n, dtype=np.int32),  # K线序号，图表以此作为数值横轴
+            "open": ohlc[0],
+            "close": ohlc[1],
+            "low": ohlc[2],
+            "high": ohlc[3],
             "volume": volume
         }
     
-    def _extract_bi_data(self, bi_list, klu_global_index_map):
-        """提取笔数据 - 遵循chan.py官方实现"""
-        bi_coords = []
-        for bi in bi_list:
-            # 使用chan.py官方方法获取笔的精确坐标和价格
-            begin_klu = bi.get_begin_klu()  # 获取起点的具体K线单元
-            end_klu = bi.get_end_klu()      # 获取终点的具体K线单元
-            begin_val = bi.get_begin_val()  # 获取起点的精确价格
-            end_val = bi.get_end_val()      # 获取终点的精确价格
-            
-            bi_coords.append({
-                "x": [int(begin_klu.idx), int(end_klu.idx)],
-                "y": [float(begin_val), float(end_val)],
-                "type": str(getattr(bi, 'type', '笔')),
-                "direction": "up" if bi.is_up() else "down",
-                "is_sure": bi.is_sure  # 是否为确定的笔
-            })
-        return bi_coords
+    def _extract_bi_data(self, bi_list):
+        """提取笔数据 - 遵循chan.py官方实现
+        
+        返回列式数组: x0/x1 为起止K线索引，y0/y1 为起止价格，is_up/is_sure 为逐笔标志
+        """
+        return self._extract_line_arrays(bi_list, lambda bi: bi.is_up(), '笔')
     
-    def _extract_zs_data(self, zs_list, klu_global_index_map):
-        """提取中枢数据 - 遵循chan.py官方实现"""
-        zones = []
-        for zs in zs_list:
+    def _extract_zs_data(self, zs_list):
+        """提取中枢数据 - 遵循chan.py官方实现
+        
+        返回列式数组: x0/x1 为起止K线索引，y0/y1 为中枢低点/高点，is_sure 为逐个中枢的确定性标识
+        """
+        n = len(zs_list)
+        x = np.empty((2, n), dtype=np.int32)
+        y = np.empty((2, n), dtype=np.float64)
+        sure = np.ones(n, dtype=bool)
+        types = ['中枢'] * n
+        # 同一列表中的对象属性一致，只需检查首个元素，循环内不再逐个getattr
+        has_sure = n > 0 and hasattr(zs_list[0], 'is_sure')
+        has_type = n > 0 and hasattr(zs_list[0], 'type')
+        for i, zs in enumerate(zs_list):
             # zs.begin 和 zs.end 已经是 CKLine_Unit 对象，直接使用它们的 idx
             # 这些 idx 已经是全局的 KLine Unit 索引，不需要再映射
-            begin_klu_idx = int(zs.begin.idx)
-            end_klu_idx = int(zs.end.idx)
-            
-            zones.append({
-                "x": [begin_klu_idx, end_klu_idx],
-                "y": [float(zs.low), float(zs.high)],
-                "type": str(getattr(zs, 'type', '中枢')),
-                "is_sure": bool(getattr(zs, 'is_sure', True))  # 添加确定性标识
-            })
-        return zones
+            x[:, i] = (zs.begin.idx, zs.end.idx)
+            y[:, i] = (zs.low, zs.high)
+            if has_sure:
+                sure[i] = zs.is_sure
+            if has_type:
+                types[i] = str(zs.type)
+        return {
+            "x0": x[0], "x1": x[1],
+            "y0": y[0], "y1": y[1],
+            "is_sure": sure,
+            "type": types
+        }
     
-    def _extract_segment_data(self, seg_list, klu_global_index_map):
-        """提取线段数据 - 遵循chan.py官方实现"""
-        segments = []
-        for seg in seg_list:
-            # 使用chan.py官方方法获取线段的精确坐标和价格
-            begin_klu = seg.get_begin_klu()  # 获取起点的具体K线单元
-            end_klu = seg.get_end_klu()      # 获取终点的具体K线单元
-            begin_val = seg.get_begin_val()  # 获取起点的精确价格
-            end_val = seg.get_end_val()      # 获取终点的精确价格
-            
-            segments.append({
-                "x": [int(begin_klu.idx), int(end_klu.idx)],
-                "y": [float(begin_val), float(end_val)],
-                "type": str(getattr(seg, 'type', '线段')),
-                "direction": "up" if seg.dir == 1 else "down",  # 线段方向
-                "is_sure": bool(getattr(seg, 'is_sure', True))  # 是否为确定的线段
-            })
-        return segments
+    def _extract_segment_data(self, seg_list):
+        """提取线段数据 - 遵循chan.py官方实现，返回结构与笔相同"""
+        return self._extract_line_arrays(seg_list, lambda seg: seg.dir == 1, '线段')
     
-    def _extract_bsp_data(self, bsp_list):
-        """提取买卖点数据"""
-        bsp_data = []
-        # BSP列表是CBSPointList对象，使用getSortedBspList()方法获取排序后的买卖点列表
-        try:
-            bsp_sorted = bsp_list.getSortedBspList()
-            for bsp in bsp_sorted:
-                # CBS_Point对象有klu属性，这是从bi.get_end_klu()获得的CKLine_Unit对象
-                # klu.idx是K线在整个序列中的索引，price是笔的结束价格
-                bsp_data.append({
-                    "kl_idx": int(bsp.klu.idx),  # K线索引
-                    "price": float(bsp.bi.get_end_val()),  # 笔的结束价格
-                    "is_buy": bool(bsp.is_buy),
-                    "type": str(bsp.type2str())
-                })
-        except Exception as e:
-            print(f"BSP提取错误: {e}")
-            # 如果提取失败，返回空列表
-            pass
-        return bsp_data
\ No newline at end of file
+    def _extract_line_arrays(self, lines, is_up, default_type):
+        """将笔/线段列表提取为列式numpy数组，预分配后单次遍历填充"""
+        n = len(lines)
+        x = np.empty((2, n), dtype=np.int32)
+        y = np.empty((2, n), dtype=np.float64)
+        up = np.empty(n, dtype=bool)
+        sure = np.ones(n, dtype=bool)  # 是否为确定的笔/线段，缺省为确定
+        types = [default_type] * n
+        # 同一列表中的对象属性一致，只需检查首个元素，循环内不再逐个getattr
+        has_sure = n > 0 and hasattr(lines[0], 'is_sure')
+        has_type = n > 0 and hasattr(lines[0], 'type')
+        for i, line in enumerate(lines):
+            # 使用chan.py官方方法获取起止点的具体K线单元和精确价格
+            x[:, i] = (line.get_begin_klu().idx, line.get_end_klu().idx)
+            y[:, i] = (line.get_begin_val(), line.get_end_val())
+            up[i] = is_up(line)
+            if has_sure:
+                sure[i] = line.is_sure
+            if has_type:
+                types[i] = str(line.type)
+        return {
+            "x0": x[0], "x1": x[1],
+            "y0": y[0], "y1": y[1],
+            "is_up": up,
+            "is_sure": sure,
+            "type": types
+        }
+    
+    def _extract_bsp_data(self, bsp_list, bsp_sorted=None):
+        """提取买卖点数据
+        
+        bsp_sorted: 调用方已取得的排序后买卖点列表，传入时不再重复排序
+        返回列式数组: kl_idx 为K线索引，price 为笔的结束价格，is_buy 为买卖标志，type 为类型标签列表
+        """
+        if bsp_sorted is None:
+            bsp_sorted = []
+            # BSP列表是CBSPointList对象，getSortedBspList()每次调用都会重新排序
+            try:
+                bsp_sorted = bsp_list.getSortedBspList()
+            except AttributeError as e:
+                # 没有买卖点列表时按无数据处理
+                print(f"BSP提取错误: {e}")
+        
+        n = len(bsp_sorted)
+        kl_idx = np.empty(n, dtype=np.int32)
+        price = np.empty(n, dtype=np.float64)
+        is_buy = np.empty(n, dtype=bool)
+        types = [None] * n
+        for i, bsp in enumerate(bsp_sorted):
+            # CBS_Point对象有klu属性，这是从bi.get_end_klu()获得的CKLine_Unit对象
+            # klu.idx是K线在整个序列中的索引，price是笔的结束价格
+            kl_idx[i] = bsp.klu.idx
+            price[i] = bsp.bi.get_end_val()
+            is_buy[i] = bsp.is_buy
+            type_key = tuple(bsp.type)
+            type_str = _BSP_TYPE_STR_CACHE.get(type_key)
+            if type_str is None:
+                type_str = _BSP_TYPE_STR_CACHE[type_key] = str(bsp.type2str())
+            types[i] = type_str
+        return {
+            "kl_idx": kl_idx,
+            "price": price,
+            "is_buy": is_buy,
+            "type": types
+        }
+
+
+@st.cache_resource(show_spinner=False)
+def get_data_service() -> StreamlitDataService:
+    """进程内共享的数据服务实例
+    
+    服务对象本身不保存会话状态，Streamlit每次交互重跑脚本时复用同一个实例；
+    首次调用发生在set_page_config之前，因此不显示缓存加载提示
+    """
+    return StreamlitDataService()
+
@@ -3,6 +3,19 @@ from datetime import datetime, timedelta
 from typing import Dict, Any, Tuple
 from .config_compiler import StreamlitConfig
 
+# A股代码前两位 -> 交易所后缀，未列出的前缀默认按深市处理
+_A_SHARE_SUFFIX = {"00": ".SZ", "30": ".SZ", "60": ".SH", "68": ".SH"}
+
+# 时间级别 -> 默认回看天数
+_LEVEL_DEFAULT_DAYS = {
+    "K_1M": 7,
+    "K_5M": 14,
+    "K_15M": 30,
+    "K_30M": 60,
+    "K_60M": 120,
+    "K_DAY": 365,
+}
+
 
 class UIManager:
     """UI管理类，处理所有用户界面配置和交互逻辑"""
@@ -25,17 +38,22 @@ class UIManager:
             st.header("🔧 图表配置")
             st.markdown("---")
             
-            # 资产信息配置
-            asset_config = self._render_asset_config()
-            
-            # 时间配置
-            date_config = self._render_time_config(asset_config.get('level', 'K_DAY'))
+            # 资产类型决定下方显示哪些控件，放在表单外以便切换后立即生效
+            market_config = self._render_market_select()
             
-            # 缠论参数配置
-            chan_params = self._render_chan_params()
-            
-            # 控制按钮
-            refresh_requested = st.button("🔄 更新图表", type="primary", use_container_width=True)
+            # 其余控件放在表单中：连续修改多个参数只在点击更新时触发一次重跑
+            with st.form("chart_config"):
+                # 资产信息配置
+                asset_config = self._render_asset_config(market_config)
+                
+                # 时间配置
+                date_config = self._render_time_config(asset_config.get('level', 'K_DAY'))
+                
+                # 缠论参数配置
+                chan_params = self._render_chan_params()
+                
+                # 控制按钮
+                refresh_requested = st.form_submit_button("🔄 更新图表", type="primary", use_container_width=True)
             
             return {
                 **asset_config,
@@ -43,32 +61,31 @@ class UIManager:
                 'refresh_requested': refresh_requested
             }, chan_params
     
-    def _render_asset_config(self) -> Dict[str, Any]:
-        """渲染资产配置"""
+    def _render_market_select(self) -> Dict[str, str]:
+        """渲染资产类型选择，返回所选市场的配置"""
         st.subheader("📊 资产信息")
-        col1, col2 = st.columns(2)
-        
-        with col1:
-            market_options = {
-                "A股": {"prefix": "", "suffix": ".SZ", "example": "000002", "type": "stock"},
-                "加密货币": {"prefix": "", "suffix": "", "example": "BTC/USDT", "type": "crypto"}
-            }
-            selected_market = st.selectbox(
-                "资产类型", 
-                options=list(market_options.keys()),
-                help="选择资产类型"
-            )
-        
-        with col2:
-            market_config = market_options[selected_market]
-            code = self._get_asset_code(market_config)
+        market_options = {
+            "A股": {"prefix": "", "suffix": ".SZ", "example": "000002", "type": "stock"},
+            "加密货币": {"prefix": "", "suffix": "", "example": "BTC/USDT", "type": "crypto"}
+        }
+        selected_market = st.selectbox(
+            "资产类型", 
+            options=list(market_options.keys()),
+            help="选择资产类型"
+        )
+        return market_options[selected_market]
+    
+    def _render_asset_config(self, market_config: Dict[str, str]) -> Dict[str, Any]:
+        """渲染资产配置"""
+        code = self._get_asset_code(market_config)
         
         # 时间级别选择
         level_options = self.config_compiler.get_available_levels()
+        level_keys = tuple(level_options)
         selected_level = st.selectbox(
             "时间级别", 
-            options=list(level_options.keys()),
-            index=list(level_options.keys()).index("K_DAY"),
+            options=level_keys,
+            index=level_keys.index("K_DAY"),
             format_func=lambda x: level_options[x],
             help="选择K线时间周期"
         )
@@ -105,12 +122,7 @@ class UIManager:
             
             # 自动格式化A股代码
             if market_config["type"] == "stock" and not code_input.startswith("HK"):
-                if code_input.startswith("00") or code_input.startswith("30"):
-                    return f"{code_input}.SZ"
-                elif code_input.startswith("60") or code_input.startswith("68"):
-                    return f"{code_input}.SH"
-                else:
-                    return f"{code_input}.SZ"
+                return code_input + _A_SHARE_SUFFIX.get(code_input[:2], ".SZ")
             
             return f"{market_config['prefix']}{code_input}{market_config['suffix']}"
     
@@ -121,34 +133,30 @@ class UIManager:
         col1, col2 = st.columns(2)
         
         # 根据时间级别调整时间范围限制
-        levels_map = {
-            "K_1M": 7,
-            "K_5M": 14,
-            "K_15M": 30,
-            "K_30M": 60,
-            "K_60M": 120,
-            "K_DAY": 365,
-        }
-        max_days_ago = levels_map[level]
+        max_days_ago = _LEVEL_DEFAULT_DAYS[level]
+        
+        # 同一次渲染内的日期控件共用一个当前时间，保证默认值和上限一致
+        now = datetime.now()
         
         with col1:
-            default_start = datetime.now() - timedelta(days=max_days_ago)
+            default_start = now - timedelta(days=max_days_ago)
             start_date = st.date_input(
                 "开始日期", 
                 value=default_start,
-                max_value=datetime.now(),
+                max_value=now,
             )
         
         with col2:
             end_date = st.date_input(
                 "结束日期", 
-                value=datetime.now(),
-                max_value=datetime.now()
+                value=now,
+                max_value=now
             )
         
+        # date_input返回datetime.date，isoformat即为YYYY-MM-DD，无需经过strftime解析格式串
         return {
-            'start_date': start_date.strftime("%Y-%m-%d"),
-            'end_date': end_date.strftime("%Y-%m-%d")
+            'start_date': start_date.isoformat(),
+            'end_date': end_date.isoformat()
         }
     
     def _render_chan_params(self) -> Dict[str, bool]:
@@ -195,15 +203,21 @@ class UIManager:
         tab1, tab2 = st.tabs(["📊 图表展示", "🔍 数据信息"])
         
         with tab1:
-            if st.button("🚀 生成/更新图表", type="primary", use_container_width=True):
-                chart_service.generate_chart(
+            # 生成图表放在回调中：点击后先于本次重跑执行，页面各处读到的都是新图表
+            st.button(
+                "🚀 生成/更新图表",
+                type="primary",
+                use_container_width=True,
+                on_click=chart_service.generate_chart,
+                kwargs=dict(
                     code=config['code'],
                     level=config['level'],
                     start_date=config['start_date'],
                     end_date=config['end_date'],
                     chan_params=chan_params
                 )
-                
+            )
+            
             if chart_service.has_chart():
                 chart_service.display_chart()
                 chart_service.display_update_time()
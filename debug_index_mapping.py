@@ -6,9 +6,13 @@
 分析K线索引与缠论对象索引的映射关系
 """
 
+import io
 import sys
 import os
+from contextlib import redirect_stdout
 from datetime import datetime
+from itertools import islice
+import numpy as np
 
 # 添加项目路径
 project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -72,24 +76,16 @@ def debug_index_mapping():
     
     # 2. 分析K线单元结构
     print("🔍 分析K线单元结构...")
-    total_klu_count = 0
-    klu_to_date_mapping = {}  # K线单元索引 -> 日期
-    date_to_klu_mapping = {}  # 日期 -> K线单元索引
-    klc_to_klu_range = {}     # 合并K线索引 -> K线单元范围
-    
-    for klc_idx, klc in enumerate(kline_list):
-        start_klu_idx = total_klu_count
-        klc_klu_count = len(klc.lst)
-        
-        for klu_local_idx, klu in enumerate(klc.lst):
-            klu_global_idx = total_klu_count + klu_local_idx
-            date_str = str(klu.time)
-            
-            klu_to_date_mapping[klu_global_idx] = date_str
-            date_to_klu_mapping[date_str] = klu_global_idx
-        
-        klc_to_klu_range[klc_idx] = (start_klu_idx, start_klu_idx + klc_klu_count - 1)
-        total_klu_count += klc_klu_count
+    # 合并K线 -> K线单元范围：由各合并K线的单元数量前缀和一次算出
+    lens = np.fromiter((len(klc.lst) for klc in kline_list), dtype=np.int64, count=len(kline_list))
+    ends = np.cumsum(lens)
+    starts = ends - lens
+    klc_to_klu_range = dict(enumerate(zip(starts.tolist(), (ends - 1).tolist())))
+    total_klu_count = int(ends[-1]) if len(ends) else 0
+    
+    # 展平所有K线单元的日期，按全局索引建立 K线单元索引 -> 日期 的映射
+    all_times = [str(klu.time) for klc in kline_list for klu in klc.lst]
+    klu_to_date_mapping = dict(enumerate(all_times))
     
     print(f"📊 总K线单元数: {total_klu_count}")
     print(f"🗓️ 日期范围: {min(klu_to_date_mapping.values())} ~ {max(klu_to_date_mapping.values())}")
@@ -97,7 +93,7 @@ def debug_index_mapping():
     
     # 3. 分析笔的索引映射
     print("📍 分析笔的索引映射...")
-    for i, bi in enumerate(kline_list.bi_list[:5]):  # 只显示前5个笔
+    for i, bi in enumerate(islice(kline_list.bi_list, 5)):  # 只显示前5个笔
         print(f"\n--- 笔 {i+1} ---")
         print(f"开始合并K线: klc[{bi.begin_klc.idx}]")
         print(f"结束合并K线: klc[{bi.end_klc.idx}]")
@@ -139,14 +135,15 @@ def debug_index_mapping():
     )
     
     print(f"📈 转换后K线数量: {len(converted_data['kline']['dates'])}")
-    print(f"📍 转换后笔数量: {len(converted_data['bi'])}")
+    print(f"📍 转换后笔数量: {len(converted_data['bi']['x0'])}")
     print()
     
     # 5. 对比分析索引映射问题
     print("🔍 对比分析索引映射问题...")
     dates = converted_data['kline']['dates']
     
-    for i, (bi_original, bi_converted) in enumerate(zip(kline_list.bi_list[:3], converted_data['bi'][:3])):
+    bi_data = converted_data['bi']
+    for i, bi_original in enumerate(islice(kline_list.bi_list, 3)):
         print(f"\n--- 笔 {i+1} 对比分析 ---")
         
         # 原始数据
@@ -156,7 +153,7 @@ def debug_index_mapping():
         print(f"【原始】实际日期: {start_date_orig} -> {end_date_orig}")
         
         # 转换后数据
-        converted_start_idx, converted_end_idx = bi_converted['x']
+        converted_start_idx, converted_end_idx = int(bi_data['x0'][i]), int(bi_data['x1'][i])
         print(f"【转换】K线单元索引: {converted_start_idx} -> {converted_end_idx}")
         
         if converted_start_idx < len(dates) and converted_end_idx < len(dates):
@@ -200,7 +197,14 @@ def debug_index_mapping():
               f"包含{klu_count}个K线单元, 日期 {first_date} ~ {last_date}")
 
 def main():
-    debug_index_mapping()
+    # 调试输出先写入内存缓冲，结束时一次性写出，避免逐行print反复加锁和刷新
+    buf = io.StringIO()
+    try:
+        with redirect_stdout(buf):
+            debug_index_mapping()
+    finally:
+        sys.stdout.write(buf.getvalue())
+        sys.stdout.flush()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,17 +1,34 @@
 import streamlit as st
 import sys
 import os
+import shutil
 import subprocess
 
+def _dir_is_empty(path: str) -> bool:
+    """目录不存在或为空时返回True；scandir读到第一个条目即可判断，不需要列出整个目录"""
+    if not os.path.isdir(path):
+        return True
+    with os.scandir(path) as entries:
+        return next(entries, None) is None
+
 # 检查chan.py子模块是否存在且不为空
 current_dir = os.path.dirname(__file__) or os.getcwd()
 chan_path = os.path.join(current_dir, 'chan.py')
-if not os.path.exists(chan_path) or not os.listdir(chan_path):
+if _dir_is_empty(chan_path):
+    if not os.path.isfile(os.path.join(current_dir, '.gitmodules')):
+        # 不在git仓库中（如直接下载的源码包），无法通过子模块获取
+        st.error("❌ chan.py不存在且当前目录没有.gitmodules，请手动下载chan.py")
+        st.stop()
+    git = shutil.which("git")
+    if git is None:
+        st.error("❌ 未找到git，无法初始化chan.py子模块")
+        st.stop()
     st.warning("⚠️ chan.py子模块未初始化，正在下载...")
     try:
-        # 初始化并更新子模块
-        result = subprocess.run(["git", "submodule", "update", "--init", "--recursive"], 
-                              capture_output=True, text=True, cwd=current_dir)
+        # 只初始化chan.py子模块，浅克隆不拉取完整历史；stdout用不到直接丢弃，网络卡住时超时退出
+        result = subprocess.run([git, "submodule", "update", "--init", "--depth", "1", "chan.py"], 
+                              stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True,
+                              cwd=current_dir, timeout=120)
         if result.returncode == 0:
             st.success("✅ chan.py子模块下载完成")
         else:
@@ -21,28 +38,35 @@ if not os.path.exists(chan_path) or not os.listdir(chan_path):
         st.error(f"❌ 子模块初始化异常: {str(e)}")
         st.stop()
 
-# 动态添加项目路径
-sys.path.insert(0, chan_path)
-
-# 导入新创建的模块
-from chan_viz.config_compiler import StreamlitConfig
-from chan_viz.data_service import StreamlitDataService
-from chan_viz.chart_render import PlotlyChartRenderer
-from chan_viz.ui_manager import UIManager
-from chan_viz.chart_service import ChartService
-
-# 初始化服务
-config_compiler = StreamlitConfig()
-data_service = StreamlitDataService()
-chart_renderer = PlotlyChartRenderer()
-
-# 创建UI管理器和图表服务
-ui_manager = UIManager(config_compiler)
-chart_service = ChartService(config_compiler, data_service, chart_renderer)
+# 服务工厂在set_page_config之前调用：关闭缓存的加载提示，否则缓存未命中时的spinner
+# 会成为第一条Streamlit命令，旧版本streamlit随后调用set_page_config会报错
+@st.cache_resource(show_spinner=False)
+def get_services():
+    """创建进程内共享的服务实例，脚本重跑时直接复用
+    
+    chan_viz各模块（及其依赖的plotly、pandas）在首次创建服务时才导入，
+    之后的重跑命中缓存，不再执行导入语句和sys.path检查
+    """
+    # 动态添加项目路径，已添加过则跳过
+    if chan_path not in sys.path:
+        sys.path.insert(0, chan_path)
+    
+    from chan_viz.config_compiler import StreamlitConfig
+    from chan_viz.data_service import get_data_service
+    from chan_viz.chart_render import PlotlyChartRenderer
+    from chan_viz.ui_manager import UIManager
+    from chan_viz.chart_service import ChartService
+    
+    config_compiler = StreamlitConfig()
+    chart_service = ChartService(config_compiler, get_data_service(), PlotlyChartRenderer())
+    return config_compiler, UIManager(config_compiler), chart_service
 
 def main():
     """简化后的主应用入口"""
     
+    # 初始化服务、UI管理器和图表服务
+    config_compiler, ui_manager, chart_service = get_services()
+    
     # 设置页面配置
     ui_manager.setup_page_config()
     
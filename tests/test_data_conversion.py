@@ -10,12 +10,23 @@
 4. 中枢数据提取和坐标映射
 5. 买卖点数据提取和坐标映射
 6. 数据完整性和一致性验证
+7. 图表渲染：线段交错、K线M4聚合与绘制分支、显示开关、figure缓存键（合成数据，不依赖chan.py）
+8. 截止到今天的区间：短时缓存、增量加载、失败重建与CChan淘汰（替身CChan，不依赖chan.py）
+9. 数据服务：load_many并发加载与BaoStock串行、磁盘缓存读写与过期清理（替身CChan，不依赖chan.py）
 """
 
 import unittest
+import functools
+import numpy as np
+import streamlit as st
 import sys
 import os
+import tempfile
+import threading
+import time
 from datetime import datetime
+from pathlib import Path
+from types import MappingProxyType, SimpleNamespace
 from typing import Dict, List, Any
 
 # 添加项目路径
@@ -24,25 +35,46 @@ sys.path.append(project_root)
 chan_path = os.path.join(project_root, 'chan.py')
 sys.path.append(chan_path)
 
+from chan_viz import chart_render
+from chan_viz import data_service as data_service_module
+from chan_viz.data_service import StreamlitDataService
+from chan_viz.chart_render import PlotlyChartRenderer, _interleave_segments, _m4_downsample
+from chan_viz.chart_service import _build_figure, _hash_chart_data
+
 try:
     from Chan import CChan
     from ChanConfig import CChanConfig
     from Common.CEnum import DATA_SRC, KL_TYPE, BI_DIR
-    from chan_viz.data_service import StreamlitDataService
     CHAN_AVAILABLE = True
 except ImportError as e:
     print(f"Warning: chan.py not available: {e}")
     CHAN_AVAILABLE = False
 
+@functools.lru_cache(maxsize=4)
+def _load_real_chan(code, level, start_date, end_date, cfg_key):
+    """构建CChan对象并按参数缓存，同一进程内重复调用不再重新拉取数据
+    
+    cfg_key为排序后的配置项元组
+    """
+    return CChan(
+        code=code,
+        begin_time=start_date,
+        end_time=end_date,
+        data_src=DATA_SRC.BAO_STOCK,
+        lv_list=[level],
+        config=CChanConfig(dict(cfg_key))
+    )
+
+@unittest.skipUnless(CHAN_AVAILABLE, "chan.py framework not available")
 class TestChanDataConversion(unittest.TestCase):
     """缠论数据转换测试类"""
     
     @classmethod
     def setUpClass(cls):
-        """测试类初始化"""
-        if not CHAN_AVAILABLE:
-            cls.skipTest(cls, "chan.py framework not available")
-        
+        """测试类初始化；chan.py不可用时整个类由skipUnless跳过，不会执行到这里"""
+        # 关闭磁盘缓存：集成测试应真正执行转换流程，也不写入用户目录下的缓存
+        cls._disk_cache_dir = data_service_module._DISK_CACHE_DIR
+        data_service_module._DISK_CACHE_DIR = None
         cls.data_service = StreamlitDataService()
         
         # 测试股票代码和参数
@@ -57,52 +89,47 @@ class TestChanDataConversion(unittest.TestCase):
         cls.end_date = "2024-01-01"
         
         print(f"Setting up test with code: {cls.test_code}, level: {cls.test_level}")
+        
+        # 真实数据只加载一次，供所有测试方法共用；加载失败时记录错误，由test_load_real_chan_data报告
+        cls.load_error = None
+        try:
+            cls.chan_data = _load_real_chan(cls.test_code, cls.test_level, cls.start_date, cls.end_date,
+                                            tuple(sorted(cls.test_config.items())))
+            cls.kline_list = cls.chan_data.kl_datas[cls.test_level]
+            # K线单元总数各测试共用，只计算一次
+            cls.total_klu_count = sum(len(klc.lst) for klc in cls.kline_list)
+        except Exception as e:
+            cls.load_error = e
     
-    def setUp(self):
-        """每个测试方法前的初始化"""
-        if not CHAN_AVAILABLE:
-            self.skipTest("chan.py framework not available")
+    @classmethod
+    def tearDownClass(cls):
+        """恢复磁盘缓存目录"""
+        data_service_module._DISK_CACHE_DIR = cls._disk_cache_dir
     
     def test_load_real_chan_data(self):
         """测试加载真实缠论数据"""
         print("\n=== 测试加载真实缠论数据 ===")
         
-        try:
-            # 创建CChan对象获取真实数据
-            chan_config = CChanConfig(self.test_config)
-            chan = CChan(
-                code=self.test_code,
-                begin_time=self.start_date,
-                end_time=self.end_date,
-                data_src=DATA_SRC.BAO_STOCK,
-                lv_list=[self.test_level],
-                config=chan_config
-            )
-            
-            # 获取K线数据
-            kline_list = chan.kl_datas[self.test_level]
-            self.assertIsNotNone(kline_list, "K线数据不应为空")
-            self.assertGreater(len(kline_list), 0, "K线数据应包含记录")
-            
-            print(f"✓ 成功加载K线数据，共 {len(kline_list)} 个合并K线")
-            print(f"✓ 笔数量: {len(kline_list.bi_list)}")
-            print(f"✓ 线段数量: {len(kline_list.seg_list)}")
-            print(f"✓ 中枢数量: {len(kline_list.zs_list)}")
-            print(f"✓ 买卖点数量: {len(kline_list.bs_point_lst.getSortedBspList())}")
-            
-            # 存储测试数据供其他测试方法使用
-            self.__class__.chan_data = chan
-            self.__class__.kline_list = kline_list
-            
-        except Exception as e:
-            self.fail(f"加载真实缠论数据失败: {e}")
+        if self.load_error is not None:
+            self.fail(f"加载真实缠论数据失败: {self.load_error}")
+        
+        # 获取K线数据
+        kline_list = self.kline_list
+        self.assertIsNotNone(kline_list, "K线数据不应为空")
+        self.assertGreater(len(kline_list), 0, "K线数据应包含记录")
+        
+        print(f"✓ 成功加载K线数据，共 {len(kline_list)} 个合并K线")
+        print(f"✓ 笔数量: {len(kline_list.bi_list)}")
+        print(f"✓ 线段数量: {len(kline_list.seg_list)}")
+        print(f"✓ 中枢数量: {len(kline_list.zs_list)}")
+        print(f"✓ 买卖点数量: {len(kline_list.bs_point_lst.getSortedBspList())}")
     
     def test_kline_data_conversion(self):
         """测试K线数据转换"""
         print("\n=== 测试K线数据转换 ===")
         
         if not hasattr(self.__class__, 'kline_list'):
-            self.skipTest("需要先运行 test_load_real_chan_data")
+            self.skipTest("真实缠论数据加载失败，见 test_load_real_chan_data")
         
         kline_list = self.__class__.kline_list
         converted_kline = self.data_service._extract_kline_data(kline_list)
@@ -118,19 +145,20 @@ class TestChanDataConversion(unittest.TestCase):
             self.assertEqual(len(converted_kline[key]), data_length, 
                            f"所有K线字段长度应一致，{key}长度为{len(converted_kline[key])}")
         
+        # 验证K线序号：与日期一一对应，从0开始连续递增
+        self.assertEqual(list(converted_kline['idx']), list(range(data_length)), "K线序号应为0到N-1")
+        
         # 验证数据类型
         self.assertIsInstance(converted_kline['dates'][0], str, "日期应为字符串类型")
         self.assertIsInstance(converted_kline['open'][0], float, "开盘价应为浮点数")
         self.assertIsInstance(converted_kline['close'][0], float, "收盘价应为浮点数")
         
-        # 验证价格合理性
-        for i in range(data_length):
-            self.assertGreaterEqual(converted_kline['high'][i], converted_kline['low'][i],
-                                  f"第{i}个K线最高价应大于等于最低价")
-            self.assertGreaterEqual(converted_kline['high'][i], converted_kline['open'][i],
-                                  f"第{i}个K线最高价应大于等于开盘价")
-            self.assertGreaterEqual(converted_kline['high'][i], converted_kline['close'][i],
-                                  f"第{i}个K线最高价应大于等于收盘价")
+        # 验证价格合理性：按列整体比较，失败时报告第一个不满足的K线
+        high = np.asarray(converted_kline['high'])
+        for key, name in (('low', '最低价'), ('open', '开盘价'), ('close', '收盘价')):
+            bad = high < np.asarray(converted_kline[key])
+            with self.subTest(field=key):
+                self.assertFalse(bad.any(), f"第{int(np.argmax(bad))}个K线最高价应大于等于{name}")
         
         print(f"✓ K线数据转换成功，共{data_length}条记录")
         print(f"✓ 首个K线: 日期={converted_kline['dates'][0]}, 开盘={converted_kline['open'][0]:.2f}")
@@ -141,7 +169,7 @@ class TestChanDataConversion(unittest.TestCase):
         print("\n=== 测试笔数据转换 ===")
         
         if not hasattr(self.__class__, 'kline_list'):
-            self.skipTest("需要先运行 test_load_real_chan_data")
+            self.skipTest("真实缠论数据加载失败，见 test_load_real_chan_data")
         
         kline_list = self.__class__.kline_list
         bi_list = kline_list.bi_list
@@ -149,59 +177,52 @@ class TestChanDataConversion(unittest.TestCase):
         if len(bi_list) == 0:
             self.skipTest("当前数据没有笔，跳过笔数据转换测试")
         
-        converted_bi = self.data_service._extract_bi_data(bi_list, self.data_service._build_klu_index_mapping(kline_list))
+        converted_bi = self.data_service._extract_bi_data(bi_list)
         
-        # 验证基础结构
-        self.assertIsInstance(converted_bi, list, "笔数据应为列表")
-        self.assertGreater(len(converted_bi), 0, "应包含笔数据")
+        # 验证基础结构：列式数组，每列长度等于笔数量
+        required_keys = ['x0', 'x1', 'y0', 'y1', 'is_up', 'is_sure', 'type']
+        for key in required_keys:
+            self.assertIn(key, converted_bi, f"笔数据应包含 {key} 字段")
+            self.assertEqual(len(converted_bi[key]), len(bi_list), f"笔数据 {key} 列长度应等于笔数量")
+        self.assertEqual(converted_bi['x0'].dtype, np.int32, "笔的x坐标应为int32数组")
+        self.assertEqual(converted_bi['y0'].dtype, np.float64, "笔的y坐标应为float64数组")
         
-        total_klu_count = sum(len(klc.lst) for klc in kline_list)
+        total_klu_count = self.total_klu_count
         print(f"✓ K线单元总数: {total_klu_count}")
         
-        for i, bi in enumerate(converted_bi):
-            required_keys = ['x', 'y', 'type', 'direction']
-            for key in required_keys:
-                self.assertIn(key, bi, f"第{i}个笔应包含 {key} 字段")
-            
-            # 验证坐标数据
-            self.assertIsInstance(bi['x'], list, "笔的x坐标应为列表")
-            self.assertIsInstance(bi['y'], list, "笔的y坐标应为列表") 
-            self.assertEqual(len(bi['x']), 2, "笔应有起点和终点x坐标")
-            self.assertEqual(len(bi['y']), 2, "笔应有起点和终点y坐标")
-            
+        # 按列整体验证，失败时报告第一个不满足条件的笔
+        start_idx, end_idx = converted_bi['x0'], converted_bi['x1']
+        start_price, end_price = converted_bi['y0'], converted_bi['y1']
+        up = converted_bi['is_up']
+        checks = (
             # 验证索引范围
-            start_idx, end_idx = bi['x']
-            self.assertGreaterEqual(start_idx, 0, f"第{i}个笔起始索引应≥0")
-            self.assertLess(end_idx, total_klu_count, f"第{i}个笔结束索引应小于总K线数")
-            self.assertLess(start_idx, end_idx, f"第{i}个笔起始索引应小于结束索引")
-            
+            ('index', start_idx < 0, "笔起始索引应≥0"),
+            ('index', end_idx >= total_klu_count, "笔结束索引应小于总K线数"),
+            ('index', start_idx >= end_idx, "笔起始索引应小于结束索引"),
             # 验证价格数据
-            start_price, end_price = bi['y']
-            self.assertIsInstance(start_price, float, "笔起始价格应为浮点数")
-            self.assertIsInstance(end_price, float, "笔结束价格应为浮点数")
-            self.assertGreater(start_price, 0, "笔起始价格应大于0")
-            self.assertGreater(end_price, 0, "笔结束价格应大于0")
-            
+            ('price', start_price <= 0, "笔起始价格应大于0"),
+            ('price', end_price <= 0, "笔结束价格应大于0"),
             # 验证方向逻辑
-            direction = bi['direction']
-            self.assertIn(direction, ['up', 'down'], f"第{i}个笔方向应为up或down")
-            
-            if direction == 'up':
-                self.assertLess(start_price, end_price, f"上升笔第{i}个起始价格应小于结束价格")
-            else:  # down
-                self.assertGreater(start_price, end_price, f"下降笔第{i}个起始价格应大于结束价格")
-        
-        print(f"✓ 笔数据转换成功，共{len(converted_bi)}个笔")
-        for i, bi in enumerate(converted_bi[:3]):  # 显示前3个笔的信息
-            print(f"  笔{i+1}: 索引{bi['x'][0]}->{bi['x'][1]}, "
-                  f"价格{bi['y'][0]:.2f}->{bi['y'][1]:.2f}, 方向{bi['direction']}")
+            ('direction', up & (start_price >= end_price), "上升笔起始价格应小于结束价格"),
+            ('direction', ~up & (start_price <= end_price), "下降笔起始价格应大于结束价格"),
+        )
+        # 每项检查整列归约为一次断言，subTest保留失败时的字段信息且不中断其余检查
+        for field, bad, message in checks:
+            with self.subTest(field=field):
+                self.assertFalse(bad.any(), f"第{int(np.argmax(bad))}个{message}")
+        
+        print(f"✓ 笔数据转换成功，共{len(bi_list)}个笔")
+        for i in range(min(3, len(bi_list))):  # 显示前3个笔的信息
+            print(f"  笔{i+1}: 索引{converted_bi['x0'][i]}->{converted_bi['x1'][i]}, "
+                  f"价格{converted_bi['y0'][i]:.2f}->{converted_bi['y1'][i]:.2f}, "
+                  f"方向{'up' if converted_bi['is_up'][i] else 'down'}")
     
     def test_segment_data_conversion(self):
         """测试线段数据转换"""
         print("\n=== 测试线段数据转换 ===")
         
         if not hasattr(self.__class__, 'kline_list'):
-            self.skipTest("需要先运行 test_load_real_chan_data")
+            self.skipTest("真实缠论数据加载失败，见 test_load_real_chan_data")
         
         kline_list = self.__class__.kline_list
         seg_list = kline_list.seg_list
@@ -209,41 +230,41 @@ class TestChanDataConversion(unittest.TestCase):
         if len(seg_list) == 0:
             self.skipTest("当前数据没有线段，跳过线段数据转换测试")
         
-        converted_seg = self.data_service._extract_segment_data(seg_list, self.data_service._build_klu_index_mapping(kline_list))
+        converted_seg = self.data_service._extract_segment_data(seg_list)
         
-        total_klu_count = sum(len(klc.lst) for klc in kline_list)
+        total_klu_count = self.total_klu_count
         
-        for i, seg in enumerate(converted_seg):
-            required_keys = ['x', 'y', 'type']
-            for key in required_keys:
-                self.assertIn(key, seg, f"第{i}个线段应包含 {key} 字段")
-            
-            # 验证坐标数据
-            self.assertEqual(len(seg['x']), 2, "线段应有起点和终点x坐标")
-            self.assertEqual(len(seg['y']), 2, "线段应有起点和终点y坐标")
-            
+        required_keys = ['x0', 'x1', 'y0', 'y1', 'is_up', 'is_sure', 'type']
+        for key in required_keys:
+            self.assertIn(key, converted_seg, f"线段数据应包含 {key} 字段")
+            self.assertEqual(len(converted_seg[key]), len(seg_list), f"线段数据 {key} 列长度应等于线段数量")
+        
+        start_idx, end_idx = converted_seg['x0'], converted_seg['x1']
+        start_price, end_price = converted_seg['y0'], converted_seg['y1']
+        checks = (
             # 验证索引范围
-            start_idx, end_idx = seg['x']
-            self.assertGreaterEqual(start_idx, 0, f"第{i}个线段起始索引应≥0")
-            self.assertLess(end_idx, total_klu_count, f"第{i}个线段结束索引应小于总K线数")
-            self.assertLess(start_idx, end_idx, f"第{i}个线段起始索引应小于结束索引")
-            
-            # 验证价格数据  
-            start_price, end_price = seg['y']
-            self.assertGreater(start_price, 0, "线段起始价格应大于0")
-            self.assertGreater(end_price, 0, "线段结束价格应大于0")
-        
-        print(f"✓ 线段数据转换成功，共{len(converted_seg)}个线段")
-        for i, seg in enumerate(converted_seg[:3]):  # 显示前3个线段的信息
-            print(f"  线段{i+1}: 索引{seg['x'][0]}->{seg['x'][1]}, "
-                  f"价格{seg['y'][0]:.2f}->{seg['y'][1]:.2f}")
+            ('index', start_idx < 0, "线段起始索引应≥0"),
+            ('index', end_idx >= total_klu_count, "线段结束索引应小于总K线数"),
+            ('index', start_idx >= end_idx, "线段起始索引应小于结束索引"),
+            # 验证价格数据
+            ('price', start_price <= 0, "线段起始价格应大于0"),
+            ('price', end_price <= 0, "线段结束价格应大于0"),
+        )
+        for field, bad, message in checks:
+            with self.subTest(field=field):
+                self.assertFalse(bad.any(), f"第{int(np.argmax(bad))}个{message}")
+        
+        print(f"✓ 线段数据转换成功，共{len(seg_list)}个线段")
+        for i in range(min(3, len(seg_list))):  # 显示前3个线段的信息
+            print(f"  线段{i+1}: 索引{converted_seg['x0'][i]}->{converted_seg['x1'][i]}, "
+                  f"价格{converted_seg['y0'][i]:.2f}->{converted_seg['y1'][i]:.2f}")
     
     def test_zs_data_conversion(self):
         """测试中枢数据转换"""
         print("\n=== 测试中枢数据转换 ===")
         
         if not hasattr(self.__class__, 'kline_list'):
-            self.skipTest("需要先运行 test_load_real_chan_data")
+            self.skipTest("真实缠论数据加载失败，见 test_load_real_chan_data")
         
         kline_list = self.__class__.kline_list
         zs_list = kline_list.zs_list
@@ -251,85 +272,94 @@ class TestChanDataConversion(unittest.TestCase):
         if len(zs_list) == 0:
             self.skipTest("当前数据没有中枢，跳过中枢数据转换测试")
         
-        converted_zs = self.data_service._extract_zs_data(zs_list, self.data_service._build_klu_index_mapping(kline_list))
+        converted_zs = self.data_service._extract_zs_data(zs_list)
         
-        total_klu_count = sum(len(klc.lst) for klc in kline_list)
+        total_klu_count = self.total_klu_count
         
-        for i, zs in enumerate(converted_zs):
-            required_keys = ['x', 'y', 'type']
-            for key in required_keys:
-                self.assertIn(key, zs, f"第{i}个中枢应包含 {key} 字段")
-            
-            # 验证坐标数据
-            self.assertEqual(len(zs['x']), 2, "中枢应有起点和终点x坐标")
-            self.assertEqual(len(zs['y']), 2, "中枢应有低点和高点y坐标")
-            
+        required_keys = ['x0', 'x1', 'y0', 'y1', 'is_sure', 'type']
+        for key in required_keys:
+            self.assertIn(key, converted_zs, f"中枢数据应包含 {key} 字段")
+            self.assertEqual(len(converted_zs[key]), len(zs_list), f"中枢数据 {key} 列长度应等于中枢数量")
+        
+        start_idx, end_idx = converted_zs['x0'], converted_zs['x1']
+        low_price, high_price = converted_zs['y0'], converted_zs['y1']
+        checks = (
             # 验证索引范围
-            start_idx, end_idx = zs['x']
-            self.assertGreaterEqual(start_idx, 0, f"第{i}个中枢起始索引应≥0")
-            self.assertLess(end_idx, total_klu_count, f"第{i}个中枢结束索引应小于总K线数")
-            self.assertLessEqual(start_idx, end_idx, f"第{i}个中枢起始索引应小于等于结束索引")
-            
-            # 验证价格范围  
-            low_price, high_price = zs['y']
-            self.assertGreater(low_price, 0, "中枢低点价格应大于0")
-            self.assertGreater(high_price, 0, "中枢高点价格应大于0")
-            self.assertLessEqual(low_price, high_price, f"第{i}个中枢低点应小于等于高点")
-        
-        print(f"✓ 中枢数据转换成功，共{len(converted_zs)}个中枢")
-        for i, zs in enumerate(converted_zs[:3]):  # 显示前3个中枢的信息
-            print(f"  中枢{i+1}: 索引{zs['x'][0]}->{zs['x'][1]}, "
-                  f"价格范围{zs['y'][0]:.2f}-{zs['y'][1]:.2f}")
+            ('index', start_idx < 0, "中枢起始索引应≥0"),
+            ('index', end_idx >= total_klu_count, "中枢结束索引应小于总K线数"),
+            ('index', start_idx > end_idx, "中枢起始索引应小于等于结束索引"),
+            # 验证价格范围
+            ('price', low_price <= 0, "中枢低点价格应大于0"),
+            ('price', high_price <= 0, "中枢高点价格应大于0"),
+            ('price', low_price > high_price, "中枢低点应小于等于高点"),
+        )
+        for field, bad, message in checks:
+            with self.subTest(field=field):
+                self.assertFalse(bad.any(), f"第{int(np.argmax(bad))}个{message}")
+        
+        print(f"✓ 中枢数据转换成功，共{len(zs_list)}个中枢")
+        for i in range(min(3, len(zs_list))):  # 显示前3个中枢的信息
+            print(f"  中枢{i+1}: 索引{converted_zs['x0'][i]}->{converted_zs['x1'][i]}, "
+                  f"价格范围{converted_zs['y0'][i]:.2f}-{converted_zs['y1'][i]:.2f}")
     
     def test_bsp_data_conversion(self):
         """测试买卖点数据转换"""
         print("\n=== 测试买卖点数据转换 ===")
         
         if not hasattr(self.__class__, 'kline_list'):
-            self.skipTest("需要先运行 test_load_real_chan_data")
+            self.skipTest("真实缠论数据加载失败，见 test_load_real_chan_data")
         
         kline_list = self.__class__.kline_list
         bsp_list = kline_list.bs_point_lst
         
-        if len(bsp_list.getSortedBspList()) == 0:
+        # getSortedBspList每次调用都会排序，只取一次并传给提取函数
+        sorted_bsp = bsp_list.getSortedBspList()
+        if not sorted_bsp:
             self.skipTest("当前数据没有买卖点，跳过买卖点数据转换测试")
         
-        converted_bsp = self.data_service._extract_bsp_data(bsp_list)
+        converted_bsp = self.data_service._extract_bsp_data(bsp_list, sorted_bsp)
         
-        total_klu_count = sum(len(klc.lst) for klc in kline_list)
+        total_klu_count = self.total_klu_count
         
-        for i, bsp in enumerate(converted_bsp):
-            required_keys = ['kl_idx', 'price', 'is_buy', 'type']
-            for key in required_keys:
-                self.assertIn(key, bsp, f"第{i}个买卖点应包含 {key} 字段")
-            
+        required_keys = ['kl_idx', 'price', 'is_buy', 'type']
+        for key in required_keys:
+            self.assertIn(key, converted_bsp, f"买卖点数据应包含 {key} 字段")
+        bsp_count = len(converted_bsp['kl_idx'])
+        for key in required_keys:
+            self.assertEqual(len(converted_bsp[key]), bsp_count, f"买卖点数据 {key} 列长度应一致")
+        
+        # 验证数组类型
+        self.assertEqual(converted_bsp['kl_idx'].dtype, np.int32, "买卖点K线索引应为int32数组")
+        self.assertEqual(converted_bsp['price'].dtype, np.float64, "买卖点价格应为float64数组")
+        self.assertEqual(converted_bsp['is_buy'].dtype, np.bool_, "is_buy应为布尔数组")
+        
+        # 按列整体验证，失败时报告第一个不满足条件的买卖点
+        kl_idx = converted_bsp['kl_idx']
+        checks = (
             # 验证索引范围
-            kl_idx = bsp['kl_idx']
-            self.assertGreaterEqual(kl_idx, 0, f"第{i}个买卖点K线索引应≥0")
-            self.assertLess(kl_idx, total_klu_count, f"第{i}个买卖点K线索引应小于总K线数")
-            
+            ('index', kl_idx < 0, "买卖点K线索引应≥0"),
+            ('index', kl_idx >= total_klu_count, "买卖点K线索引应小于总K线数"),
             # 验证价格
-            price = bsp['price']
-            self.assertIsInstance(price, float, "买卖点价格应为浮点数")
-            self.assertGreater(price, 0, "买卖点价格应大于0")
-            
-            # 验证买卖属性
-            is_buy = bsp['is_buy']
-            self.assertIsInstance(is_buy, bool, "is_buy应为布尔值")
-            
-            # 验证类型
-            bsp_type = bsp['type']
-            self.assertIsInstance(bsp_type, str, "买卖点类型应为字符串")
+            ('price', converted_bsp['price'] <= 0, "买卖点价格应大于0"),
+        )
+        for field, bad, message in checks:
+            with self.subTest(field=field):
+                self.assertFalse(bad.any(), f"第{int(np.argmax(bad))}个{message}")
+        
+        # 验证类型
+        with self.subTest(field='type'):
+            self.assertTrue(all(isinstance(t, str) for t in converted_bsp['type']), "买卖点类型应为字符串")
         
-        buy_count = sum(1 for bsp in converted_bsp if bsp['is_buy'])
-        sell_count = len(converted_bsp) - buy_count
+        buy_count = int(converted_bsp['is_buy'].sum())
+        sell_count = bsp_count - buy_count
         
-        print(f"✓ 买卖点数据转换成功，共{len(converted_bsp)}个买卖点")
+        print(f"✓ 买卖点数据转换成功，共{bsp_count}个买卖点")
         print(f"  其中买点{buy_count}个，卖点{sell_count}个")
         
-        for i, bsp in enumerate(converted_bsp[:3]):  # 显示前3个买卖点的信息
-            label = "买点" if bsp['is_buy'] else "卖点"
-            print(f"  {label}{i+1}: K线索引{bsp['kl_idx']}, 价格{bsp['price']:.2f}, 类型{bsp['type']}")
+        for i in range(min(3, bsp_count)):  # 显示前3个买卖点的信息
+            label = "买点" if converted_bsp['is_buy'][i] else "卖点"
+            print(f"  {label}{i+1}: K线索引{converted_bsp['kl_idx'][i]}, "
+                  f"价格{converted_bsp['price'][i]:.2f}, 类型{converted_bsp['type'][i]}")
     
     def test_complete_data_conversion_integration(self):
         """测试完整数据转换集成"""
@@ -359,35 +389,27 @@ class TestChanDataConversion(unittest.TestCase):
             # 验证数据一致性：所有时间相关的索引都应该在合理范围内
             dates_count = len(kline_data['dates'])
             
-            # 验证笔的索引范围
-            for bi in converted_data['bi']:
-                for idx in bi['x']:
-                    self.assertGreaterEqual(idx, 0, "笔索引应≥0")
-                    self.assertLess(idx, dates_count, "笔索引应小于日期总数")
-            
-            # 验证线段的索引范围
-            for seg in converted_data['segment']:
-                for idx in seg['x']:
-                    self.assertGreaterEqual(idx, 0, "线段索引应≥0")
-                    self.assertLess(idx, dates_count, "线段索引应小于日期总数")
-            
-            # 验证中枢的索引范围
-            for zs in converted_data['central_zone']:
-                for idx in zs['x']:
-                    self.assertGreaterEqual(idx, 0, "中枢索引应≥0")
-                    self.assertLess(idx, dates_count, "中枢索引应小于日期总数")
-            
-            # 验证买卖点的索引范围
-            for bsp in converted_data['buy_sell_points']:
-                self.assertGreaterEqual(bsp['kl_idx'], 0, "买卖点索引应≥0")
-                self.assertLess(bsp['kl_idx'], dates_count, "买卖点索引应小于日期总数")
+            # 验证笔、线段、中枢、买卖点的索引范围，每类整列检查一次
+            bi_data = converted_data['bi']
+            seg_data = converted_data['segment']
+            zs_data = converted_data['central_zone']
+            index_columns = (
+                ('bi', "笔", np.concatenate([bi_data['x0'], bi_data['x1']])),
+                ('segment', "线段", np.concatenate([seg_data['x0'], seg_data['x1']])),
+                ('central_zone', "中枢", np.concatenate([zs_data['x0'], zs_data['x1']])),
+                ('buy_sell_points', "买卖点", converted_data['buy_sell_points']['kl_idx']),
+            )
+            for field, label, idx in index_columns:
+                with self.subTest(field=field):
+                    self.assertFalse((idx < 0).any(), f"{label}索引应≥0")
+                    self.assertFalse((idx >= dates_count).any(), f"{label}索引应小于日期总数")
             
             print("✓ 完整数据转换集成测试通过")
             print(f"  K线数据: {len(kline_data['dates'])} 条")
-            print(f"  笔数据: {len(converted_data['bi'])} 个")  
-            print(f"  线段数据: {len(converted_data['segment'])} 个")
-            print(f"  中枢数据: {len(converted_data['central_zone'])} 个")
-            print(f"  买卖点数据: {len(converted_data['buy_sell_points'])} 个")
+            print(f"  笔数据: {len(bi_data['x0'])} 个")  
+            print(f"  线段数据: {len(seg_data['x0'])} 个")
+            print(f"  中枢数据: {len(zs_data['x0'])} 个")
+            print(f"  买卖点数据: {len(converted_data['buy_sell_points']['kl_idx'])} 个")
             
             # 进行数据逻辑一致性检查
             self._validate_data_logic_consistency(converted_data)
@@ -401,39 +423,624 @@ class TestChanDataConversion(unittest.TestCase):
         
         # 验证笔的连续性：相邻笔的终点和起点应该连接
         bi_data = data['bi']
-        if len(bi_data) > 1:
-            for i in range(len(bi_data) - 1):
-                current_end_idx = bi_data[i]['x'][1]
-                next_start_idx = bi_data[i + 1]['x'][0] 
-                # 注意：笔之间可能不是完全连续的，因为可能有合并K线
-                self.assertLessEqual(current_end_idx, next_start_idx, 
-                                   f"笔{i+1}的终点索引应≤笔{i+2}的起点索引")
+        # 注意：笔之间可能不是完全连续的，因为可能有合并K线
+        # 按列错位比较相邻笔，失败时报告第一对不满足条件的笔
+        # 少于两个笔时切片为空，any()为False，无需单独判断笔数量
+        gap = bi_data['x1'][:-1] > bi_data['x0'][1:]
+        if gap.any():
+            i = int(np.argmax(gap))
+            self.fail(f"笔{i+1}的终点索引应≤笔{i+2}的起点索引")
         
         # 验证方向交替：相邻笔的方向应该相反
-        if len(bi_data) > 1:
-            for i in range(len(bi_data) - 1):
-                current_direction = bi_data[i]['direction']
-                next_direction = bi_data[i + 1]['direction']
-                self.assertNotEqual(current_direction, next_direction,
-                                  f"相邻笔{i+1}和{i+2}的方向应该相反")
+        same_direction = bi_data['is_up'][:-1] == bi_data['is_up'][1:]
+        if same_direction.any():
+            i = int(np.argmax(same_direction))
+            self.fail(f"相邻笔{i+1}和{i+2}的方向应该相反")
         
         # 验证买卖点位置合理性：买卖点应该在K线索引范围内
         dates_count = len(data['kline']['dates'])
-        for bsp in data['buy_sell_points']:
-            kl_idx = bsp['kl_idx']
-            self.assertGreaterEqual(kl_idx, 0, "买卖点索引应≥0")
-            self.assertLess(kl_idx, dates_count, "买卖点索引应在K线范围内")
+        kl_idx = data['buy_sell_points']['kl_idx']
+        self.assertFalse((kl_idx < 0).any(), "买卖点索引应≥0")
+        self.assertFalse((kl_idx >= dates_count).any(), "买卖点索引应在K线范围内")
         
         print("✓ 数据逻辑一致性验证通过")
 
 
+def _make_kline(n, seed=0):
+    """生成n根随机游走K线的列式数据"""
+    rng = np.random.default_rng(seed)
+    close = 100 + np.cumsum(rng.normal(0, 1, n))
+    open_ = close + rng.normal(0, 0.5, n)
+    return {
+        "dates": [f"2023-01-01 #{i}" for i in range(n)],
+        "idx": np.arange(n, dtype=np.int32),
+        "open": open_,
+        "close": close,
+        "low": np.minimum(open_, close) - rng.uniform(0, 1, n),
+        "high": np.maximum(open_, close) + rng.uniform(0, 1, n),
+        "volume": np.zeros(n)
+    }
+
+
+def _make_lines(x0, x1, y0, y1):
+    """生成笔/线段的列式数据，方向按价格推出，全部为确定状态"""
+    y0, y1 = np.asarray(y0, dtype=np.float64), np.asarray(y1, dtype=np.float64)
+    return {
+        "x0": np.asarray(x0, dtype=np.int32),
+        "x1": np.asarray(x1, dtype=np.int32),
+        "y0": y0,
+        "y1": y1,
+        "is_up": y1 > y0,
+        "is_sure": np.ones(len(y0), dtype=bool),
+        "type": ["bi"] * len(y0)
+    }
+
+
+def _make_data(n=100):
+    """生成包含K线、笔、线段、中枢、买卖点的完整可视化数据"""
+    return {
+        "kline": _make_kline(n),
+        "bi": _make_lines([0, 10, 20], [10, 20, 30], [95.0, 105.0, 96.0], [105.0, 96.0, 104.0]),
+        "segment": _make_lines([0, 30], [30, 60], [95.0, 110.0], [110.0, 90.0]),
+        "central_zone": {
+            "x0": np.array([10, 40], dtype=np.int32),
+            "x1": np.array([30, 60], dtype=np.int32),
+            "y0": np.array([97.0, 92.0]),
+            "y1": np.array([103.0, 99.0]),
+            "is_sure": np.array([True, False]),
+            "type": ["zs", "zs"]
+        },
+        "buy_sell_points": {
+            "kl_idx": np.array([10, 20], dtype=np.int32),
+            "price": np.array([105.0, 96.0]),
+            "is_buy": np.array([False, True]),
+            "type": ["1", "2"]
+        }
+    }
+
+
+def _count_segments(traces):
+    """WebGL K线按涨跌分组，每组依次为影线、实体两条trace，每根K线占 [起点, 终点, 间隔] 三个点
+
+    返回绘制的K线总数
+    """
+    return sum(len(t['x']) // 3 for t in traces[0::2])
+
+
+class TestChartHelpers(unittest.TestCase):
+    """渲染辅助函数测试类"""
+
+    def test_interleave_segments(self):
+        """测试数值数组交错：起点、终点依次排列，每组后跟NaN间隔"""
+        out = _interleave_segments(np.array([1.0, 2.0, 3.0]), np.array([4.0, 5.0, 6.0]))
+        self.assertEqual(len(out), 9)
+        np.testing.assert_array_equal(out[0::3], [1.0, 2.0, 3.0])
+        np.testing.assert_array_equal(out[1::3], [4.0, 5.0, 6.0])
+        self.assertTrue(np.isnan(out[2::3]).all(), "每组之后应为NaN间隔")
+        self.assertFalse(np.isnan(np.delete(out, np.s_[2::3])).any(), "间隔只应出现在每组之后")
+
+    def test_interleave_segments_object(self):
+        """测试字符串数组交错：间隔为None"""
+        out = _interleave_segments(np.array(['a', 'b'], dtype=object), np.array(['c', 'd'], dtype=object))
+        self.assertEqual(out.tolist(), ['a', 'c', None, 'b', 'd', None])
+
+    def test_bsp_marker_size(self):
+        """测试买卖点标记大小按最低类别确定，未知类型使用默认大小"""
+        renderer = PlotlyChartRenderer()
+        for bsp_type, size in (('1', 14), ('1p', 14), ('1,2', 14), ('2s', 12), ('3a', 10), ('3b', 10), ('', 12)):
+            with self.subTest(bsp_type=bsp_type):
+                self.assertEqual(renderer._get_bsp_marker_size(bsp_type), size)
+
+    def test_m4_downsample(self):
+        """测试M4聚合：每桶的开/收为首/末K线，高/低为桶内极值，横坐标为桶中点"""
+        kline = _make_kline(1003)
+        x = kline['idx'].astype(np.float64)
+        target = 100
+        bx, bo, bh, bl, bc = _m4_downsample(x, kline['open'], kline['high'], kline['low'], kline['close'], target)
+        for arr in (bx, bo, bh, bl, bc):
+            self.assertEqual(len(arr), target, "聚合后K线数量应等于目标桶数")
+
+        bounds = np.linspace(0, len(x), target + 1).astype(np.int64)
+        self.assertEqual(bounds[0], 0)
+        self.assertEqual(bounds[-1], len(x), "所有桶应覆盖全部K线")
+        for i, (start, end) in enumerate(zip(bounds[:-1], bounds[1:])):
+            with self.subTest(bucket=i):
+                self.assertEqual(bo[i], kline['open'][start])
+                self.assertEqual(bc[i], kline['close'][end - 1])
+                self.assertEqual(bh[i], kline['high'][start:end].max())
+                self.assertEqual(bl[i], kline['low'][start:end].min())
+                self.assertEqual(bx[i], (x[start] + x[end - 1]) / 2)
+
+
+class TestKlineTraces(unittest.TestCase):
+    """K线绘制分支测试类"""
+
+    def setUp(self):
+        self.renderer = PlotlyChartRenderer()
+
+    def _kline_traces(self, n):
+        kline = _make_kline(n)
+        return self.renderer._build_kline_traces(kline, kline['idx'], np.asarray(kline['dates'], dtype=object))
+
+    def test_candlestick_below_threshold(self):
+        """测试K线数量不超过阈值时使用SVG蜡烛图"""
+        n = chart_render._WEBGL_KLINE_THRESHOLD
+        traces = self._kline_traces(n)
+        self.assertEqual([t['type'] for t in traces], ['candlestick'])
+        self.assertEqual(len(traces[0]['x']), n)
+
+    def test_webgl_above_threshold(self):
+        """测试K线数量超过阈值时改用WebGL线段，且不聚合"""
+        n = chart_render._WEBGL_KLINE_THRESHOLD + 1
+        traces = self._kline_traces(n)
+        self.assertTrue(all(t['type'] == 'scattergl' for t in traces), "超过阈值应全部为WebGL trace")
+        self.assertEqual(_count_segments(traces), n, "未超过聚合目标时应绘制全部K线")
+        self.assertEqual(sum(t['showlegend'] for t in traces), 1, "K线图例只应出现一次")
+
+    def test_downsample_above_target(self):
+        """测试K线数量超过聚合目标时按目标桶数绘制"""
+        traces = self._kline_traces(chart_render._KLINE_DOWNSAMPLE_TARGET * 3 + 7)
+        self.assertEqual(_count_segments(traces), chart_render._KLINE_DOWNSAMPLE_TARGET)
+
+    def test_prices_keep_float64(self):
+        """测试价格按float64传输：BTC价格约1e5时float32会丢失分位"""
+        for n in (chart_render._WEBGL_KLINE_THRESHOLD, chart_render._WEBGL_KLINE_THRESHOLD + 1):
+            kline = _make_kline(n)
+            for column in ('open', 'close', 'low', 'high'):
+                kline[column] = np.round(kline[column] * 1000, 2)
+            traces = self.renderer._build_kline_traces(kline, kline['idx'], np.asarray(kline['dates'], dtype=object))
+            with self.subTest(n=n):
+                if traces[0]['type'] == 'candlestick':
+                    for column in ('open', 'close', 'low', 'high'):
+                        np.testing.assert_array_equal(traces[0][column], kline[column])
+                else:
+                    for trace in traces:
+                        self.assertEqual(trace['y'].dtype, np.float64)
+                    self.assertEqual(np.nanmax([np.nanmax(t['y']) for t in traces]), kline['high'].max())
+                    self.assertEqual(np.nanmin([np.nanmin(t['y']) for t in traces]), kline['low'].min())
+
+    def test_line_prices_keep_float64(self):
+        """测试笔、线段、中枢、买卖点的价格按float64传输"""
+        data = _make_data()
+        for section, columns in (('bi', ('y0', 'y1')), ('segment', ('y0', 'y1')),
+                                 ('central_zone', ('y0', 'y1')), ('buy_sell_points', ('price',))):
+            for column in columns:
+                data[section][column] = data[section][column] * 1000 + 0.01
+        fig = self.renderer.create_chan_chart(data, "K_DAY", "BTC/USDT")
+        bi = [t for t in fig.data if t.legendgroup == 'bi']
+        self.assertTrue(bi)
+        ys = np.concatenate([np.asarray(t.y, dtype=np.float64) for t in bi])
+        self.assertTrue(set(data['bi']['y0']) <= set(ys[~np.isnan(ys)]), "笔端点价格应原样传输")
+        for trace in fig.data:
+            if trace.type != 'candlestick':
+                with self.subTest(trace=trace.name):
+                    self.assertEqual(np.asarray(trace.y).dtype, np.float64)
+
+
+class TestDisplayFlags(unittest.TestCase):
+    """显示开关测试类"""
+
+    # 显示开关 -> 对应trace的legendgroup
+    GROUPS = {'show_bi': 'bi', 'show_seg': 'segment', 'show_zs': 'central_zone'}
+
+    def setUp(self):
+        self.renderer = PlotlyChartRenderer()
+        self.data = _make_data()
+
+    def _trace_groups(self, display=None):
+        fig = self.renderer.create_chan_chart(self.data, "K_DAY", "000001.SZ", display=display)
+        return [(t.type, t.legendgroup, t.name) for t in fig.data]
+
+    def test_all_shown_by_default(self):
+        """测试缺省时全部显示"""
+        groups = self._trace_groups()
+        for flag, group in self.GROUPS.items():
+            with self.subTest(flag=flag):
+                self.assertTrue(any(g == group for _, g, _ in groups), f"缺省时应绘制{group}")
+        self.assertTrue(any(name in ('买点', '卖点') for _, _, name in groups), "缺省时应绘制买卖点")
+
+    def test_each_flag_removes_its_traces(self):
+        """测试关闭单个开关只移除对应的trace"""
+        full = self._trace_groups()
+        for flag, group in self.GROUPS.items():
+            with self.subTest(flag=flag):
+                groups = self._trace_groups({flag: False})
+                self.assertFalse(any(g == group for _, g, _ in groups), f"{flag}=False时不应绘制{group}")
+                self.assertEqual(groups, [t for t in full if t[1] != group], "其余trace应保持不变")
+        with self.subTest(flag='show_bsp'):
+            groups = self._trace_groups({'show_bsp': False})
+            self.assertEqual(groups, [t for t in full if t[2] not in ('买点', '卖点')])
+
+    def test_all_hidden_keeps_kline(self):
+        """测试全部关闭时只保留K线"""
+        groups = self._trace_groups({flag: False for flag in ('show_bi', 'show_seg', 'show_zs', 'show_bsp')})
+        self.assertEqual([t[0] for t in groups], ['candlestick'])
+
+
+class TestFigureCacheKey(unittest.TestCase):
+    """figure缓存键测试类"""
+
+    def test_hash_stable(self):
+        """测试相同数据得到相同摘要"""
+        self.assertEqual(_hash_chart_data(_make_data()), _hash_chart_data(_make_data()))
+
+    def test_hash_changes_with_any_column(self):
+        """测试任意一列的任意一个值变化都会改变摘要"""
+        base = _hash_chart_data(_make_data())
+        for section, columns in _make_data().items():
+            for column in columns:
+                with self.subTest(column=f"{section}.{column}"):
+                    data = _make_data()
+                    value = data[section][column]
+                    if isinstance(value, list):
+                        value[-1] = value[-1] + "x"
+                    elif value.dtype == bool:
+                        value[-1] = not value[-1]
+                    else:
+                        value[-1] += 1
+                    self.assertNotEqual(_hash_chart_data(data), base)
+
+    def test_cached_figure_not_shared(self):
+        """测试缓存的figure每次返回副本：修改一次的结果不影响下次命中"""
+        data = _make_data()
+        args = (_hash_chart_data(data), "000001.SZ", "K_DAY", (), PlotlyChartRenderer(), data)
+        _build_figure.clear()
+        first = _build_figure(*args)
+        title = first.layout.title.text
+        first.update_layout(title="已修改")
+        second = _build_figure(*args)
+        self.assertIsNot(first, second)
+        self.assertEqual(second.layout.title.text, title)
+        self.assertEqual(len(second.data), len(first.data))
+
+
+def _cache_data_works_in_bare_mode():
+    """直接运行测试时没有Streamlit运行时，较早版本（如1.22）的st.cache_data此时不缓存"""
+    calls = []
+
+    @st.cache_data
+    def probe():
+        calls.append(1)
+
+    probe()
+    probe()
+    return len(calls) == 1
+
+
+def _fake_klu(day):
+    """替身K线单元：2024年1月的第day天，ts与日期同序"""
+    return SimpleNamespace(time=SimpleNamespace(year=2024, month=1, day=day, ts=day))
+
+
+class _FakeStockAPI:
+    """替身数据源：返回 bars 中不早于begin_date的K线，fail为True时取数失败"""
+
+    bars = []
+    fail = False
+    requests = []
+
+    def __init__(self, code, k_type, begin_date, end_date, autype):
+        self.begin_day = int(begin_date[-2:])
+        self.requests.append(begin_date)
+
+    @classmethod
+    def do_init(cls):
+        pass
+
+    @classmethod
+    def do_close(cls):
+        pass
+
+    def get_kl_data(self):
+        if self.fail:
+            raise ConnectionError("模拟取数失败")
+        return [_fake_klu(day) for day in self.bars if day >= self.begin_day]
+
+
+class _FakeLiveChan:
+    """替身CChan：构造时载入数据源当前的全部K线，trigger_load追加新K线"""
+
+    builds = 0
+
+    def __init__(self, code, begin_time, end_time, data_src, lv_list, config):
+        type(self).builds += 1
+        self.code = code
+        self.autype = None
+        self.kl_datas = {lv_list[0]: [SimpleNamespace(lst=[_fake_klu(day)]) for day in _FakeStockAPI.bars]}
+
+    def GetStockAPI(self):
+        return _FakeStockAPI
+
+    def trigger_load(self, inputs):
+        for kl_type, klus in inputs.items():
+            self.kl_datas[kl_type].extend(SimpleNamespace(lst=[klu]) for klu in klus)
+
+
+class _LiveStubDataService(StreamlitDataService):
+    """跳过K线转换，只返回各K线的ts"""
+
+    def _convert_to_visualization_data(self, chan, level):
+        return {'kline': {'ts': [klc.lst[-1].time.ts for klc in chan.kl_datas[level]]}}
+
+
+class TestLiveReload(unittest.TestCase):
+    """截止到今天的区间加载测试类"""
+
+    def setUp(self):
+        self._saved = (data_service_module._chan_module, data_service_module.CHAN_AVAILABLE)
+        data_service_module._chan_module = {
+            'CChan': _FakeLiveChan,
+            'CChanConfig': dict,
+            'DATA_SRC': {'BAO_STOCK': 'BAO_STOCK', 'CCXT': 'CCXT'},
+            'KL_TYPE': SimpleNamespace(K_DAY='K_DAY'),
+            'LEVELS': MappingProxyType({'K_DAY': 'K_DAY'}),
+        }
+        data_service_module.CHAN_AVAILABLE = True
+        _FakeStockAPI.bars = [1, 2, 3]
+        _FakeStockAPI.fail = False
+        _FakeStockAPI.requests = []
+        _FakeLiveChan.builds = 0
+        self._clear()
+        self.service = _LiveStubDataService()
+
+    def tearDown(self):
+        data_service_module._chan_module, data_service_module.CHAN_AVAILABLE = self._saved
+        self._clear()
+
+    def _clear(self):
+        """清空结果缓存和保留的CChan对象"""
+        data_service_module.StreamlitDataService._load_live_chan_data.clear()
+        with data_service_module._LIVE_CHANS_LOCK:
+            data_service_module._LIVE_CHANS.clear()
+
+    def _load(self, code='000001.SZ'):
+        """不指定截止日期，即截止到今天"""
+        return self.service.load_chan_data(code, 'K_DAY', {})['kline']['ts']
+
+    @unittest.skipUnless(_cache_data_works_in_bare_mode(), "当前streamlit版本在无运行时时不缓存")
+    def test_cached_within_ttl(self):
+        """测试缓存有效期内重跑不再访问数据源"""
+        self.assertEqual(self._load(), [1, 2, 3])
+        _FakeStockAPI.bars.append(4)
+        self.assertEqual(self._load(), [1, 2, 3], "缓存有效期内应直接返回缓存结果")
+        self.assertEqual(_FakeLiveChan.builds, 1)
+        self.assertEqual(_FakeStockAPI.requests, [], "缓存命中时不应拉取新K线")
+
+    def test_incremental_load(self):
+        """测试缓存过期后复用CChan，从最后一根K线所在日期拉取，只喂入新K线"""
+        self._load()
+        _FakeStockAPI.bars.extend([4, 5])
+        data_service_module.StreamlitDataService._load_live_chan_data.clear()
+
+        self.assertEqual(self._load(), [1, 2, 3, 4, 5], "最后一根K线及之前的K线不应重复喂入")
+        self.assertEqual(_FakeLiveChan.builds, 1, "缓存过期后应复用已有CChan")
+        self.assertEqual(_FakeStockAPI.requests, ['2024-01-03'])
+
+    def test_rebuild_on_failure(self):
+        """测试增量拉取失败时重新构建CChan"""
+        self._load()
+        _FakeStockAPI.bars.append(4)
+        _FakeStockAPI.fail = True
+        data_service_module.StreamlitDataService._load_live_chan_data.clear()
+
+        self.assertEqual(self._load(), [1, 2, 3, 4])
+        self.assertEqual(_FakeLiveChan.builds, 2, "增量拉取失败时应重新构建")
+
+    def test_lru_eviction(self):
+        """测试保留的CChan超出上限时淘汰最久未使用的"""
+        limit = data_service_module._LIVE_CHAN_LIMIT
+        codes = [f"{i:06d}.SZ" for i in range(limit + 1)]
+        for code in codes[:limit]:
+            self._load(code)
+        # 重新使用第一个代码，使第二个代码成为最久未使用的
+        data_service_module.StreamlitDataService._load_live_chan_data.clear()
+        self._load(codes[0])
+        self._load(codes[limit])
+
+        kept = [key[0] for key in data_service_module._LIVE_CHANS]
+        self.assertEqual(len(kept), limit)
+        self.assertNotIn(f"sz.{codes[1][:6]}", kept, "最久未使用的CChan应被淘汰")
+        self.assertEqual(kept[-2:], [f"sz.{codes[0][:6]}", f"sz.{codes[limit][:6]}"], "最近使用的应排在末尾")
+
+
+class _FakeChan:
+    """替身CChan：记录各数据源同时进行的加载数量，代码以bad结尾时模拟加载失败"""
+
+    lock = threading.Lock()
+    active = {}
+    max_active = {}
+
+    def __init__(self, code, begin_time, end_time, data_src, lv_list, config):
+        self.code = code
+        with self.lock:
+            self.active[data_src] = self.active.get(data_src, 0) + 1
+            self.max_active[data_src] = max(self.max_active.get(data_src, 0), self.active[data_src])
+        try:
+            time.sleep(0.05)
+            if code.endswith('bad'):
+                raise ValueError("模拟加载失败")
+        finally:
+            with self.lock:
+                self.active[data_src] -= 1
+
+
+class _StubDataService(StreamlitDataService):
+    """跳过K线转换，直接返回代码，便于核对结果归属"""
+
+    def _convert_to_visualization_data(self, chan, level):
+        return {'kline': {'code': [chan.code]}}
+
+
+class TestLoadMany(unittest.TestCase):
+    """load_many测试类"""
+
+    def setUp(self):
+        self._saved = (data_service_module._chan_module, data_service_module.CHAN_AVAILABLE, data_service_module._DISK_CACHE_DIR)
+        # 磁盘缓存写到临时目录，不影响用户目录下的真实缓存
+        self._tmp = tempfile.TemporaryDirectory()
+        data_service_module._DISK_CACHE_DIR = Path(self._tmp.name)
+        data_service_module._chan_module = {
+            'CChan': _FakeChan,
+            'CChanConfig': dict,
+            'DATA_SRC': {'BAO_STOCK': 'BAO_STOCK', 'CCXT': 'CCXT'},
+            'KL_TYPE': SimpleNamespace(K_DAY='K_DAY'),
+            'LEVELS': MappingProxyType({'K_DAY': 'K_DAY'}),
+        }
+        data_service_module.CHAN_AVAILABLE = True
+        _FakeChan.active.clear()
+        _FakeChan.max_active.clear()
+        self._clear()
+        self.service = _StubDataService()
+
+    def tearDown(self):
+        data_service_module._chan_module, data_service_module.CHAN_AVAILABLE, data_service_module._DISK_CACHE_DIR = self._saved
+        self._tmp.cleanup()
+        self._clear()
+
+    def _clear(self):
+        """清空两条加载路径的缓存和保留的CChan对象"""
+        data_service_module.StreamlitDataService._load_chan_data.clear()
+        data_service_module.StreamlitDataService._load_live_chan_data.clear()
+        with data_service_module._LIVE_CHANS_LOCK:
+            data_service_module._LIVE_CHANS.clear()
+
+    CODES = ['000001.SZ', '600000.SH', '000002.SZ', 'BTC', 'ETH', 'BTC/USDT', 'sz.bad']
+
+    def _check_results(self, results, errors):
+        """结果按代码返回，失败代码单独报告，BaoStock同一时间只有一个加载"""
+        self.assertEqual(set(results), set(self.CODES) - {'sz.bad'}, "加载失败的代码不应出现在结果中")
+        self.assertEqual(set(errors), {'sz.bad'}, "加载失败的代码应报告原因")
+        self.assertIn("模拟加载失败", errors['sz.bad'])
+        self.assertEqual(results['000001.SZ']['kline']['code'], ['sz.000001'], "结果应归属到对应代码")
+        self.assertEqual(results['BTC']['kline']['code'], ['BTC/USDT'], "加密货币代码应补全交易对")
+        self.assertEqual(_FakeChan.max_active['BAO_STOCK'], 1, "BaoStock加载应串行执行")
+        self.assertGreater(_FakeChan.max_active['CCXT'], 1, "CCXT加载应并发执行")
+
+    def test_load_many(self):
+        """测试历史区间的并发加载"""
+        self._check_results(*self.service.load_many(self.CODES, 'K_DAY', {}, '2023-01-01', '2023-06-30'))
+
+    def test_load_many_live(self):
+        """测试截止到今天的区间的并发加载：工作线程共用进程内保留的CChan，数量不超过上限"""
+        for _ in range(2):
+            # 第二轮清空结果缓存，工作线程会同时取出和放回保留的CChan
+            data_service_module.StreamlitDataService._load_live_chan_data.clear()
+            self._check_results(*self.service.load_many(self.CODES, 'K_DAY', {}))
+        self.assertEqual(len(data_service_module._LIVE_CHANS), data_service_module._LIVE_CHAN_LIMIT)
+
+
+class TestDiskCache(unittest.TestCase):
+    """磁盘缓存测试类"""
+
+    def setUp(self):
+        self._saved_dir = data_service_module._DISK_CACHE_DIR
+        self._tmp = tempfile.TemporaryDirectory()
+        data_service_module._DISK_CACHE_DIR = Path(self._tmp.name)
+        self.path = data_service_module._cache_path('sz.000001', 'K_DAY', '2023-01-01', '2023-06-30', ())
+        self.data = {
+            'kline': {
+                'dates': ['2023-01-03', '2023-01-04', '2023-01-05'],
+                'idx': np.arange(3, dtype=np.int32),
+                'close': np.array([10.5, 10.75, 11.0]),
+            },
+            'bi': {
+                'x0': np.array([0], dtype=np.int32),
+                'is_up': np.array([True]),
+                'type': ['bi'],
+            },
+            'buy_sell_points': {
+                'kl_idx': np.array([], dtype=np.int32),
+                'type': [],
+            },
+        }
+
+    def tearDown(self):
+        data_service_module._DISK_CACHE_DIR = self._saved_dir
+        self._tmp.cleanup()
+
+    def _expire(self, path):
+        """将文件修改时间调到TTL之前"""
+        old = time.time() - data_service_module._DISK_CACHE_TTL - 60
+        os.utime(path, (old, old))
+
+    def test_round_trip(self):
+        """测试写入后读回：列表仍为列表，数组保持dtype和取值"""
+        data_service_module._write_disk_cache(self.path, self.data)
+        loaded = data_service_module._read_disk_cache(self.path)
+
+        self.assertEqual(set(loaded), set(self.data))
+        for section, columns in self.data.items():
+            self.assertEqual(set(loaded[section]), set(columns))
+            for column, value in columns.items():
+                with self.subTest(column=f"{section}.{column}"):
+                    restored = loaded[section][column]
+                    if isinstance(value, list):
+                        self.assertEqual(restored, value)
+                    else:
+                        self.assertEqual(restored.dtype, value.dtype)
+                        np.testing.assert_array_equal(restored, value)
+        self.assertEqual(list(Path(self._tmp.name).iterdir()), [self.path], "目录中不应留下临时文件")
+
+    def test_version_in_key(self):
+        """测试格式版本变化后不再命中旧文件"""
+        data_service_module._write_disk_cache(self.path, self.data)
+        saved_version = data_service_module._CACHE_VERSION
+        data_service_module._CACHE_VERSION = saved_version + 1
+        try:
+            path = data_service_module._cache_path('sz.000001', 'K_DAY', '2023-01-01', '2023-06-30', ())
+        finally:
+            data_service_module._CACHE_VERSION = saved_version
+        self.assertNotEqual(path, self.path)
+        self.assertIsNone(data_service_module._read_disk_cache(path))
+
+    def test_missing(self):
+        """测试文件不存在时返回None"""
+        self.assertIsNone(data_service_module._read_disk_cache(self.path))
+
+    def test_damaged_file_removed(self):
+        """测试截断的文件按未命中处理并被删除"""
+        data_service_module._write_disk_cache(self.path, self.data)
+        content = self.path.read_bytes()
+        self.path.write_bytes(content[:len(content) // 2])
+
+        self.assertIsNone(data_service_module._read_disk_cache(self.path))
+        self.assertFalse(self.path.exists(), "损坏的缓存文件应被删除")
+
+    def test_expired_file_removed(self):
+        """测试过期文件按未命中处理并被删除"""
+        data_service_module._write_disk_cache(self.path, self.data)
+        self._expire(self.path)
+
+        self.assertIsNone(data_service_module._read_disk_cache(self.path))
+        self.assertFalse(self.path.exists(), "过期的缓存文件应被删除")
+
+    def test_write_prunes_expired(self):
+        """测试写入时清理目录中其他过期文件"""
+        stale = data_service_module._cache_path('sz.000002', 'K_DAY', '2023-01-01', '2023-06-30', ())
+        data_service_module._write_disk_cache(stale, self.data)
+        self._expire(stale)
+
+        data_service_module._write_disk_cache(self.path, self.data)
+        self.assertFalse(stale.exists(), "过期的缓存文件应在写入时被清理")
+        self.assertTrue(self.path.exists())
+
+    def test_disabled(self):
+        """测试未启用磁盘缓存时不读写文件"""
+        data_service_module._DISK_CACHE_DIR = None
+        path = data_service_module._cache_path('sz.000001', 'K_DAY', '2023-01-01', '2023-06-30', ())
+        self.assertIsNone(path)
+        data_service_module._write_disk_cache(path, self.data)
+        self.assertIsNone(data_service_module._read_disk_cache(path))
+        self.assertEqual(list(Path(self._tmp.name).iterdir()), [])
+
+
 def run_tests():
     """运行测试的主函数"""
     print("=" * 60)
     print("🧪 缠论数据转换单元测试")
     print("=" * 60)
     
-    # 创建测试套件，按照依赖顺序执行
+    # 创建测试套件：数据在setUpClass中统一加载，各测试互不依赖，按此顺序便于阅读输出
     test_suite = unittest.TestSuite()
     test_class = TestChanDataConversion
     
@@ -450,6 +1057,12 @@ def run_tests():
     # 最后执行集成测试
     test_suite.addTest(test_class('test_complete_data_conversion_integration'))
     
+    # 使用合成数据的测试，不依赖chan.py
+    loader = unittest.TestLoader()
+    for synthetic_class in (TestChartHelpers, TestKlineTraces, TestDisplayFlags, TestFigureCacheKey,
+                            TestLiveReload, TestLoadMany, TestDiskCache):
+        test_suite.addTests(loader.loadTestsFromTestCase(synthetic_class))
+    
     # 运行测试
     runner = unittest.TextTestRunner(verbosity=2, stream=sys.stdout)
     result = runner.run(test_suite)